@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import logging
+from requests import Session
+from llm_prompts.prompts import affiliate_prompt, prompt_for_parsing_techspec
+from src.utils import clear_folder
+from src.openai_client import upload_files, get_client
+from src.openai_batch import run_batch_analysis, BATCH_FILE_TTL
+from src.goszakup_parser import get_access_token, get_full_zakup_info, download_techspec_files, headers
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+techspec_folder = os.path.join("downloads", "goskazup_techspecs")
+
+PROMPTS = {
+    "techspec_analyzed": prompt_for_parsing_techspec,
+    "affiliate_analysis": affiliate_prompt,
+}
+
+
+def make_prepare_advert(session, client):
+    def prepare_advert(advert_id):
+        logging.info(f'Собираю полную информацию по закупке {advert_id}')
+        result = get_full_zakup_info(session, advert_id)
+
+        advert_folder = os.path.join(techspec_folder, str(advert_id))
+        os.makedirs(advert_folder, exist_ok=True)
+        clear_folder(advert_folder)
+        download_techspec_files(session, result['techspec_files'], advert_folder)
+
+        files = os.listdir(advert_folder)
+        if len(files) > 3:
+            raise Exception('Too many files to upload!')
+
+        file_ids = [
+            upload_files(client, os.path.join(advert_folder, file_name), expires_in=BATCH_FILE_TTL)
+            for file_name in files
+        ]
+
+        os.makedirs('reports', exist_ok=True)
+        report_path = os.path.join('reports', f'goszakup_{advert_id}.json')
+        # повторная подготовка после истечения файлов: анализы прошлых batch не отправляются заново, сохраняем их
+        if os.path.exists(report_path):
+            with open(report_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+            for key in PROMPTS:
+                if key in previous:
+                    result[key] = previous[key]
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=4)
+
+        return file_ids
+
+    return prepare_advert
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Анализ объявлений через OpenAI Batch API')
+    parser.add_argument('advert_ids', nargs='*', help='ID объявлений')
+    parser.add_argument('--ids-file', help='Файл со списком ID, по одному на строку')
+    parser.add_argument('--model', default='gpt-5-nano')
+    parser.add_argument('--poll-interval', type=int, default=30)
+    parser.add_argument('--state-dir', default='batches')
+    args = parser.parse_args()
+
+    advert_ids = list(args.advert_ids)
+    if args.ids_file:
+        with open(args.ids_file, 'r', encoding='utf-8') as f:
+            advert_ids.extend(line.strip() for line in f if line.strip())
+
+    token = get_access_token(headers)
+    session_headers = headers.copy()
+    session_headers['X-Auth-Token'] = token
+
+    session = Session()
+    session.headers.update(session_headers)
+
+    # OPENAI_BASE_URL можно направить на локальную заглушку batch-эндпоинтов
+    client = get_client()
+
+    summary = run_batch_analysis(
+        client,
+        advert_ids,
+        make_prepare_advert(session, client),
+        PROMPTS,
+        model=args.model,
+        state_dir=args.state_dir,
+        poll_interval=args.poll_interval,
+    )
+    print(json.dumps(summary, ensure_ascii=False, indent=4))
@@ -0,0 +1,396 @@
+"""Local stand-in for goszakup.gov.kz, the zakup.sk.kz JSON API, the help.ecc.kz auth bridge and the OpenAI API.
+
+Serves the fixtures from benchmarks/fixtures with configurable latency and error injection:
+
+    python -m benchmarks.mock_server --port 8765 --latency 0.05 --llm-latency 2 --error-rate 0.01
+
+and point the app at it:
+
+    GOSZAKUP_URL=http://127.0.0.1:8765 ECC_URL=http://127.0.0.1:8765 SAMRUK_URL=http://127.0.0.1:8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+ANALYSIS_TEXT = (
+    "1) Предмет закупки\n"
+    "Канцелярские товары и бумага для офисной техники, 40 позиций.\n"
+    "2) Ключевые требования\n"
+    "- Формат и плотность бумаги указаны точно\n"
+    "- Поставка в течение 30 календарных дней\n"
+    "3) Риски\n"
+    "- Требования к упаковке совпадают с каталогом одного поставщика\n"
+    "Вероятность аффилированности: 35%\n"
+)
+
+_ids = itertools.count(1)
+
+
+def _load_fixture(*parts):
+    with open(os.path.join(FIXTURES_DIR, *parts), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _new_id(prefix):
+    return f'{prefix}_{next(_ids):06d}'
+
+
+def _parse_multipart(body, content_type):
+    """{field name: bytes} from a multipart/form-data body"""
+    boundary = content_type.split('boundary=')[-1].strip('"').encode()
+    fields = {}
+    for part in body.split(b'--' + boundary):
+        if b'\r\n\r\n' not in part:
+            continue
+        head, _, value = part.partition(b'\r\n\r\n')
+        match = re.search(rb'name="([^"]+)"', head)
+        if match:
+            fields[match.group(1).decode()] = value[:-2] if value.endswith(b'\r\n') else value
+    return fields
+
+
+class MockState:
+    def __init__(self, latency=0.0, llm_latency=0.0, error_rate=0.0, stream_chunks=20, listing_adverts=1000):
+        self.latency = latency
+        self.listing_adverts = listing_adverts
+        self.llm_latency = llm_latency
+        self.error_rate = error_rate
+        self.stream_chunks = stream_chunks
+        self.fixtures = {
+            name: _load_fixture('goszakup', f'{name}.html')
+            for name in ('general', 'lots', 'documents', 'files_modal')
+        }
+        self.samruk_fixtures = {
+            name: _load_fixture('samruk', f'{name}.json')
+            for name in ('adverts', 'advert', 'lots', 'files')
+        }
+        self.techspec = _load_fixture('techspecs', 'techspec.txt').encode('utf-8')
+        self.files = {}
+        self.batches = {}
+        # custom_ids of batch requests that always fail, on top of error_rate
+        self.failing_custom_ids = set()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.injected_errors = 0
+
+    def should_fail(self):
+        failed = self.error_rate > 0 and random.random() < self.error_rate
+        if failed:
+            with self.lock:
+                self.injected_errors += 1
+        return failed
+
+
+def make_response_object(model, text=ANALYSIS_TEXT, input_tokens=12000):
+    output_tokens = len(text) // 3
+    return {
+        'id': _new_id('resp'),
+        'object': 'response',
+        'created_at': int(time.time()),
+        'status': 'completed',
+        'model': model,
+        'output': [{
+            'type': 'message',
+            'id': _new_id('msg'),
+            'status': 'completed',
+            'role': 'assistant',
+            'content': [{'type': 'output_text', 'text': text, 'annotations': []}],
+        }],
+        'parallel_tool_calls': True,
+        'tool_choice': 'auto',
+        'tools': [],
+        'usage': {
+            'input_tokens': input_tokens,
+            'input_tokens_details': {'cached_tokens': 0},
+            'output_tokens': output_tokens,
+            'output_tokens_details': {'reasoning_tokens': 0},
+            'total_tokens': input_tokens + output_tokens,
+        },
+    }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server_version = 'MockServer/1.0'
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def _base_url(self):
+        return f'http://{self.headers.get("Host")}'
+
+    def _send(self, status, body, content_type='application/json', extra_headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, ensure_ascii=False)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _render(self, name, advert_id):
+        html = self.state.fixtures[name]
+        return html.replace('{{BASE_URL}}', self._base_url()).replace('{{ADVERT_ID}}', str(advert_id))
+
+    def _render_listing(self, query):
+        """Search results page with `listing_adverts` synthetic adverts, ids from 30000001"""
+        params = parse_qs(query)
+        per_page = int(params.get('count_record', ['500'])[0])
+        page = int(params.get('page', ['1'])[0])
+        first = (page - 1) * per_page
+        ids = range(30000001 + first, 30000001 + min(first + per_page, self.state.listing_adverts))
+        rows = ''.join(f'<tr><td>{i}</td><td><a href="{self._base_url()}/ru/announce/index/{i}">Объявление {i}</a></td></tr>'
+                       for i in ids)
+        return (f'<table id="search-result"><tbody>{rows}</tbody></table>'
+                f'<div class="dataTables_info">Показано с {first + 1} по {first + len(ids)} из {self.state.listing_adverts}</div>')
+
+    def _render_samruk(self, name, advert_id):
+        return json.loads(self.state.samruk_fixtures[name].replace('{{ADVERT_ID}}', str(advert_id)))
+
+    def _render_samruk_listing(self, query):
+        """Page of `listing_adverts` synthetic adverts, ids from 40000001; `page` starts from 0 like in the API"""
+        params = parse_qs(query)
+        size = int(params.get('size', ['100'])[0])
+        page = int(params.get('page', ['0'])[0])
+        total = self.state.listing_adverts
+        ids = range(40000001 + page * size, 40000001 + min((page + 1) * size, total))
+        listing = self._render_samruk('adverts', 0)
+        template = listing['content'][0]
+        return dict(
+            listing,
+            content=[dict(template, id=str(i), advertNumber=f'2025-{i}') for i in ids],
+            number=page, size=size, totalElements=total, totalPages=max(-(-total // size), 1),
+        )
+
+    def _handle_samruk(self, path, query):
+        if path == '/eprocsearch/api/external/adverts':
+            return self._send(200, self._render_samruk_listing(query))
+
+        match = re.fullmatch(r'/eprocsearch/api/external/adverts/(\d+)(?:/(lots|files))?', path)
+        if match:
+            return self._send(200, self._render_samruk(match.group(2) or 'advert', match.group(1)))
+
+        if re.fullmatch(r'/eprocfilestorage/api/external/files/\d+/download', path):
+            return self._send(200, self.state.techspec, 'application/octet-stream')
+
+        return self._send(404, {'error': f'Unknown path {path}'})
+
+    def _handle(self, method):
+        with self.state.lock:
+            self.state.requests += 1
+        url = urlparse(self.path)
+        path = url.path
+        body = self._read_body() if method == 'POST' else b''
+
+        if path.startswith('/v1/'):
+            return self._handle_openai(method, path, body)
+
+        time.sleep(self.state.latency)
+        if self.state.should_fail():
+            return self._send(500, '<h1>Internal Server Error</h1>', 'text/html')
+
+        if path == '/bridge/auth':
+            return self._send(200, {'creds': {'auth_token': 'mock-auth-token'}})
+        if path == '/bridge/session':
+            return self._send(200, {'data': {'access_token': 'mock-access-token'}})
+
+        if path.startswith(('/eprocsearch/', '/eprocfilestorage/')):
+            return self._handle_samruk(path, url.query)
+
+        if path == '/ru/search/announce':
+            return self._send(200, self._render_listing(url.query), 'text/html; charset=utf-8')
+
+        match = re.fullmatch(r'/ru/announce/index/(\d+)', path)
+        if match:
+            tab = parse_qs(url.query).get('tab', ['general'])[0]
+            if tab not in ('general', 'lots', 'documents'):
+                tab = 'general'
+            return self._send(200, self._render(tab, match.group(1)), 'text/html; charset=utf-8')
+
+        match = re.fullmatch(r'/ru/announce/actionAjaxModalShowFiles/(\d+)/(\d+)', path)
+        if match:
+            advert_id = match.group(1)[:-3]  # only names the files: sample lot ids are <advert id>001
+            return self._send(200, self._render('files_modal', advert_id), 'text/html; charset=utf-8')
+
+        if path.startswith('/files/'):
+            return self._send(200, self.state.techspec, 'application/octet-stream')
+
+        return self._send(404, {'error': f'Unknown path {path}'})
+
+    def _handle_openai(self, method, path, body):
+        if method == 'POST' and path == '/v1/files':
+            fields = _parse_multipart(body, self.headers.get('Content-Type', ''))
+            file_id = _new_id('file')
+            self.state.files[file_id] = fields.get('file', b'')
+            return self._send(200, {
+                'id': file_id, 'object': 'file', 'bytes': len(self.state.files[file_id]),
+                'created_at': int(time.time()), 'filename': 'upload',
+                'purpose': (fields.get('purpose') or b'assistants').decode(), 'status': 'processed',
+            })
+
+        match = re.fullmatch(r'/v1/files/([\w-]+)/content', path)
+        if method == 'GET' and match:
+            return self._send(200, self.state.files.get(match.group(1), b''), 'application/octet-stream')
+
+        if method == 'POST' and path == '/v1/responses':
+            if self.state.should_fail():
+                return self._send(429, {'error': {'message': 'Rate limit reached (injected)', 'type': 'rate_limit_error'}},
+                                  extra_headers={'retry-after': '0.1'})
+            request = json.loads(body or b'{}')
+            response = make_response_object(request.get('model', 'gpt-5-nano'))
+            if request.get('stream'):
+                return self._stream_response(response)
+            time.sleep(self.state.llm_latency)
+            return self._send(200, response)
+
+        if method == 'POST' and path == '/v1/batches':
+            return self._create_batch(json.loads(body or b'{}'))
+
+        match = re.fullmatch(r'/v1/batches/([\w-]+)', path)
+        if method == 'GET' and match and match.group(1) in self.state.batches:
+            return self._send(200, self.state.batches[match.group(1)])
+
+        return self._send(404, {'error': {'message': f'Unknown path {path}'}})
+
+    def _stream_response(self, response):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        text = response['output'][0]['content'][0]['text']
+        chunk_size = max(len(text) // self.state.stream_chunks, 1)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        delay = self.state.llm_latency / max(len(chunks), 1)
+
+        def event(data):
+            self.wfile.write(f'event: {data["type"]}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+
+        sequence = itertools.count()
+        in_progress = dict(response, status='in_progress', output=[], usage=None)
+        event({'type': 'response.created', 'sequence_number': next(sequence), 'response': in_progress})
+        for chunk in chunks:
+            time.sleep(delay)
+            event({
+                'type': 'response.output_text.delta', 'sequence_number': next(sequence),
+                'item_id': response['output'][0]['id'], 'output_index': 0, 'content_index': 0,
+                'delta': chunk, 'logprobs': [],
+            })
+        event({'type': 'response.completed', 'sequence_number': next(sequence), 'response': response})
+        self.close_connection = True
+
+    def _create_batch(self, request):
+        lines = self.state.files.get(request.get('input_file_id'), b'').decode('utf-8').splitlines()
+        output, errors = [], []
+        for line in filter(None, lines):
+            item = json.loads(line)
+            if item['custom_id'] in self.state.failing_custom_ids or self.state.should_fail():
+                errors.append({'id': _new_id('batch_req'), 'custom_id': item['custom_id'], 'response': None,
+                               'error': {'code': 'server_error', 'message': 'Injected failure'}})
+            else:
+                output.append({'id': _new_id('batch_req'), 'custom_id': item['custom_id'], 'error': None,
+                               'response': {'status_code': 200, 'request_id': _new_id('req'),
+                                            'body': make_response_object(item['body'].get('model', 'gpt-5-nano'))}})
+
+        def store(rows):
+            if not rows:
+                return None
+            file_id = _new_id('file')
+            self.state.files[file_id] = '\n'.join(json.dumps(r, ensure_ascii=False) for r in rows).encode('utf-8')
+            return file_id
+
+        batch = {
+            'id': _new_id('batch'), 'object': 'batch', 'endpoint': request.get('endpoint'),
+            'completion_window': request.get('completion_window', '24h'), 'status': 'completed',
+            'input_file_id': request.get('input_file_id'), 'created_at': int(time.time()),
+            'output_file_id': store(output), 'error_file_id': store(errors),
+            'request_counts': {'total': len(output) + len(errors), 'completed': len(output), 'failed': len(errors)},
+        }
+        self.state.batches[batch['id']] = batch
+        return self._send(200, dict(batch, status='validating'))
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # listen() backlog, the default 5 stalls 100 concurrent clients
+
+
+class MockServer:
+    def __init__(self, host='127.0.0.1', port=0, **state_options):
+        self.httpd = _HTTPServer((host, port), MockHandler)
+        self.httpd.state = MockState(**state_options)
+        self.thread = None
+
+    @property
+    def state(self):
+        return self.httpd.state
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def env(self):
+        """Environment variables that point the app at this server"""
+        return {
+            'GOSZAKUP_URL': self.url,
+            'ECC_URL': self.url,
+            'SAMRUK_URL': self.url,
+            'OPENAI_BASE_URL': self.url + '/v1',
+            'OPENAI_API_KEY': 'mock',
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='mock-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа портала, сек')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='Время генерации ответа LLM, сек')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля запросов с ошибкой (500 / 429)')
+    parser.add_argument('--listing-adverts', type=int, default=1000, help='Объявлений в результатах поиска')
+    args = parser.parse_args()
+
+    server = MockServer(args.host, args.port, latency=args.latency, llm_latency=args.llm_latency,
+                        error_rate=args.error_rate, listing_adverts=args.listing_adverts)
+    print(f'Mock server on {server.url}')
+    for key, value in server.env().items():
+        print(f'{key}={value}')
+    server.httpd.serve_forever()
@@ -0,0 +1,98 @@
+"""Records real pages of one advert into benchmarks/fixtures/goszakup (or samruk).
+
+    python -m benchmarks.record_fixtures 15755249
+    python -m benchmarks.record_fixtures --source samruk 1164921
+
+Absolute links and the advert id are replaced by the {{BASE_URL}} / {{ADVERT_ID}} placeholders
+that benchmarks/mock_server.py fills in. For samruk the JSON API responses are saved together with
+the advert modal rendered by the browser (needs Firefox), tests/test_samryk_api.py checks that both
+give the same data. Review the files for personal data before committing.
+"""
+import argparse
+import json
+import os
+import re
+from requests import Session
+from bs4 import BeautifulSoup
+from src.goszakup_parser import get_access_token, send_request, headers, GOSZAKUP_URL
+
+from benchmarks.mock_server import FIXTURES_DIR
+
+REGEX = r'actionModalShowFiles\((.*)\)'
+
+
+def to_template(html, advert_id):
+    return html.replace(GOSZAKUP_URL, '{{BASE_URL}}').replace(str(advert_id), '{{ADVERT_ID}}')
+
+
+def record(session, advert_id):
+    base_url = f'{GOSZAKUP_URL}/ru/announce/index/{advert_id}'
+    pages = {}
+    for tab in ('general', 'lots', 'documents'):
+        response = send_request(session, f'{base_url}?tab={tab}')
+        response.raise_for_status()
+        pages[tab] = response.text
+
+    soup = BeautifulSoup(pages['documents'], 'html.parser')
+    button = soup.find('button', onclick=re.compile(REGEX))
+    params = re.search(REGEX, button['onclick']).group(1).split(',')
+    response = send_request(session, f'{GOSZAKUP_URL}/ru/announce/actionAjaxModalShowFiles/{params[0]}/{params[1]}')
+    response.raise_for_status()
+    pages['files_modal'] = response.text
+
+    out_dir = os.path.join(FIXTURES_DIR, 'goszakup')
+    os.makedirs(out_dir, exist_ok=True)
+    for name, html in pages.items():
+        path = os.path.join(out_dir, f'{name}.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(to_template(html, advert_id))
+        print(f'Saved {path}')
+
+
+def record_samruk(advert_id):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    from src import samryk_api, samryk_parser
+
+    session = samryk_api.get_session()
+    responses = {
+        'adverts': samryk_api._get_json(session, samryk_api.ADVERTS_URL, page=0, size=1,
+                                        **samryk_api.DEFAULT_FILTERS),
+        'advert': samryk_api._get_json(session, samryk_api.ADVERT_URL.format(advert_id=advert_id)),
+        'lots': samryk_api._get_json(session, samryk_api.LOTS_URL.format(advert_id=advert_id)),
+        'files': samryk_api._get_json(session, samryk_api.FILES_URL.format(advert_id=advert_id)),
+    }
+
+    driver = samryk_parser.get_driver()
+    try:
+        driver.get(f'https://zakup.sk.kz/#/ext(popup:item/{advert_id}/advert)')
+        WebDriverWait(driver, samryk_parser.TIMEOUT).until(EC.presence_of_element_located(samryk_parser.MODAL_BODY))
+        modal_html = driver.find_element(By.CSS_SELECTOR, 'div.modal-content').get_attribute('outerHTML')
+    finally:
+        driver.quit()
+
+    out_dir = os.path.join(FIXTURES_DIR, 'samruk')
+    os.makedirs(out_dir, exist_ok=True)
+    pages = {f'{name}.json': json.dumps(data, ensure_ascii=False, indent=4) for name, data in responses.items()}
+    pages['advert_modal.html'] = modal_html
+    for name, text in pages.items():
+        path = os.path.join(out_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text.replace(str(advert_id), '{{ADVERT_ID}}'))
+        print(f'Saved {path}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('advert_id', type=int)
+    parser.add_argument('--source', choices=('goszakup', 'samruk'), default='goszakup')
+    args = parser.parse_args()
+
+    if args.source == 'samruk':
+        record_samruk(args.advert_id)
+    else:
+        session = Session()
+        session.headers.update(headers)
+        session.headers['X-Auth-Token'] = get_access_token(headers)
+        record(session, args.advert_id)
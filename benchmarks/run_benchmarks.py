@@ -0,0 +1,331 @@
+"""Offline benchmarks of the goszakup parsers and the report pipeline.
+
+    python -m benchmarks.run_benchmarks                  # run and compare with benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --save-baseline  # run and store the results as the new baseline
+
+Everything runs against benchmarks/mock_server.py, nothing leaves the machine.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_server import MockServer, FIXTURES_DIR
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+CONCURRENCY_LEVELS = (1, 10, 100)
+
+# results where bigger is better, everything else is a latency / size
+HIGHER_IS_BETTER = ('ops_per_sec', 'adverts_per_sec', 'pages_per_sec')
+
+
+def _render_fixture(name, base_url='http://127.0.0.1', advert_id=15755249):
+    with open(os.path.join(FIXTURES_DIR, 'goszakup', f'{name}.html'), 'r', encoding='utf-8') as f:
+        html = f.read()
+    return html.replace('{{BASE_URL}}', base_url).replace('{{ADVERT_ID}}', str(advert_id)).encode('utf-8')
+
+
+def _measure(func, min_time=1.0):
+    """Calls func repeatedly for at least min_time seconds, returns calls per second"""
+    func()  # warm-up
+    calls = 0
+    started_at = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - started_at
+        if elapsed >= min_time:
+            return calls / elapsed
+
+
+def bench_parsers(min_time):
+    from bs4 import BeautifulSoup
+    from src import goszakup_parser as gp
+
+    general = _render_fixture('general')
+    lots = _render_fixture('lots')
+    documents = _render_fixture('documents')
+    files_modal = _render_fixture('files_modal')
+
+    general_soup = BeautifulSoup(general, 'html.parser')
+    panels = general_soup.find_all('div', class_='panel-body')
+    lots_soup = BeautifulSoup(lots, 'html.parser').find('div', class_='table-responsive')
+
+    cases = {
+        'soup_general': lambda: BeautifulSoup(general, 'html.parser'),
+        'soup_lots': lambda: BeautifulSoup(lots, 'html.parser'),
+        'soup_documents': lambda: BeautifulSoup(documents, 'html.parser'),
+        'parse_advert_view_info': lambda: gp.parse_advert_view_info(panels[0]),
+        'parse_obshie_svedeniya': lambda: gp.parse_obshie_svedeniya(panels[1].find_all('table')[0]),
+        'parse_organizator_info': lambda: gp.parse_organizator_info(panels[1].find_all('table')[1]),
+        'parse_lots': lambda: gp.parse_lots(lots_soup),
+        'techspec_rows': lambda: BeautifulSoup(files_modal, 'html.parser').find_all('tr'),
+    }
+
+    results = {}
+    for name, func in cases.items():
+        results[name] = {'ops_per_sec': round(_measure(func, min_time), 1)}
+        print(f'  {name:<28} {results[name]["ops_per_sec"]:>10.1f} ops/s')
+    return results
+
+
+def bench_parse_pool(min_time, threads=8):
+    """Page parsing from several threads at once, inline (GIL-bound) vs in the warm process pool"""
+    from src import goszakup_parser as gp
+
+    pages = [(gp.parse_general_page, _render_fixture('general')),
+             (gp.parse_lots_page, _render_fixture('lots')),
+             (gp.parse_documents_page, _render_fixture('documents'))]
+
+    configured = gp.PARSE_PROCESSES
+    results = {}
+    for processes in sorted({0, os.cpu_count() or 1}):
+        gp.PARSE_PROCESSES = processes
+        gp.get_parse_executor()
+        parsed = [0] * threads
+        deadline = time.perf_counter() + min_time
+
+        def run(i):
+            while time.perf_counter() < deadline:
+                func, content = pages[parsed[i] % len(pages)]
+                gp.run_parser(func, content)
+                parsed[i] += 1
+
+        started_at = time.perf_counter()
+        workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        result = {'pages_per_sec': round(sum(parsed) / (time.perf_counter() - started_at), 1)}
+        results[f'processes_{processes}'] = result
+        print(f'  parse pages x{threads} threads, {processes} processes  {result["pages_per_sec"]:>8.1f} pages/s')
+
+        if gp._parse_executor is not None:
+            gp._parse_executor.shutdown()
+            gp._parse_executor = None
+    gp.PARSE_PROCESSES = configured
+    return results
+
+
+def bench_techspec_index(min_time, size=10000):
+    """Signature of the fixture techspec and a top-k query against an index of `size` adverts"""
+    import random
+    from src import techspec_index as ti
+
+    path = os.path.join(FIXTURES_DIR, 'techspecs', 'techspec.txt')
+    signature = ti.techspec_signature([path])
+    index = ti.TechspecIndex(os.path.join(tempfile.mkdtemp(prefix='techspec-index-'), 'index.jsonl'))
+    rng = random.Random(1)
+    for i in range(size):
+        # a few near duplicates of the fixture among unrelated techspecs
+        if i % 1000 == 0:
+            index.add(i, [value if rng.random() < 0.9 else rng.getrandbits(57) for value in signature])
+        else:
+            index.add(i, [rng.getrandbits(57) for _ in range(ti.SIGNATURE_SIZE)])
+
+    cases = {
+        'techspec_signature': lambda: ti.techspec_signature([path]),
+        f'query_{size}': lambda: index.query(signature),
+    }
+    results = {}
+    for name, func in cases.items():
+        results[name] = {'ops_per_sec': round(_measure(func, min_time), 1)}
+        print(f'  {name:<28} {results[name]["ops_per_sec"]:>10.1f} ops/s')
+    return results
+
+
+def bench_full_zakup_info(adverts):
+    from requests import Session
+    from src import goszakup_parser as gp
+
+    session = Session()
+    session.headers.update(gp.headers)
+    latencies = []
+    for advert_id in range(adverts):
+        started_at = time.perf_counter()
+        gp.get_full_zakup_info(session, 20000000 + advert_id)
+        latencies.append(time.perf_counter() - started_at)
+
+    result = {'p50_seconds': round(statistics.median(latencies), 4),
+              'adverts_per_sec': round(adverts / sum(latencies), 2)}
+    print(f'  get_full_zakup_info          p50 {result["p50_seconds"]:.4f}s, {result["adverts_per_sec"]} adverts/s')
+    return result
+
+
+def _run_reports(concurrency, first_id, pipeline):
+    return asyncio.run(_arun_reports(concurrency, first_id, pipeline))
+
+
+async def _arun_reports(concurrency, first_id, pipeline):
+    import server
+
+    latencies = [None] * concurrency
+    status_latencies = []
+    # threads pipeline: a thread per advert, like server.run_task
+    threads = ThreadPoolExecutor(max_workers=concurrency) if pipeline == 'threads' else None
+
+    async def run(i):
+        started_at = time.perf_counter()
+        if threads is None:
+            await server.aparse_advert(first_id + i)
+        else:
+            await asyncio.get_running_loop().run_in_executor(threads, server.parse_advert, first_id + i)
+        latencies[i] = time.perf_counter() - started_at
+
+    async def poll_status():
+        # what a browser polling /api/status sees while the reports are built
+        client = server.app.test_client()
+        while True:
+            await asyncio.sleep(0.01)
+            started_at = time.perf_counter()
+            await client.get(f'/api/status/{first_id}')
+            status_latencies.append(time.perf_counter() - started_at)
+
+    poller = asyncio.create_task(poll_status())
+    started_at = time.perf_counter()
+    await asyncio.gather(*(run(i) for i in range(concurrency)))
+    wall = time.perf_counter() - started_at
+    poller.cancel()
+    if threads is not None:
+        threads.shutdown()
+
+    failed = [i for i in range(concurrency) if server.tasks_status[str(first_id + i)]['status'] != 'completed']
+    return latencies, wall, failed, status_latencies
+
+
+def _p95(values):
+    ordered = sorted(values) or [0.0]
+    return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+
+def bench_reports(measure_memory, pipeline):
+    results = {}
+    first_id = 30000000
+    _run_reports(1, first_id - 1, pipeline)  # warm-up: imports, clients, connection pools
+    for concurrency in CONCURRENCY_LEVELS:
+        latencies, wall, failed, status_latencies = _run_reports(concurrency, first_id, pipeline)
+        first_id += concurrency
+        result = {
+            'p50_seconds': round(statistics.median(latencies), 4),
+            'p95_seconds': round(_p95(latencies), 4),
+            'adverts_per_sec': round(concurrency / wall, 2),
+            'status_p95_ms': round(_p95(status_latencies) * 1000, 2),
+            'failed': len(failed),
+        }
+
+        if measure_memory:
+            # separate pass: tracemalloc slows the code down too much to time it at the same run
+            tracemalloc.start()
+            _run_reports(concurrency, first_id, pipeline)
+            first_id += concurrency
+            result['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+            tracemalloc.stop()
+
+        results[f'concurrency_{concurrency}'] = result
+        print(f'  parse_advert x{concurrency:<4} p50 {result["p50_seconds"]:.3f}s  p95 {result["p95_seconds"]:.3f}s  '
+              f'{result["adverts_per_sec"]} adverts/s  status p95 {result["status_p95_ms"]} ms  failed {result["failed"]}'
+              + (f'  peak {result["peak_memory_mb"]} MB' if measure_memory else ''))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints the difference with the baseline, returns the list of regressions"""
+    regressions = []
+    print(f'\nComparison with baseline (threshold {threshold:.0%}):')
+    for group, metrics in results.items():
+        for name, values in metrics.items():
+            for key, value in values.items():
+                old = baseline.get(group, {}).get(name, {}).get(key)
+                if not old or key == 'failed':
+                    continue
+                change = (value - old) / old
+                worse = -change if key in HIGHER_IS_BETTER else change
+                mark = 'REGRESSION' if worse > threshold else ('improved' if worse < -threshold else '')
+                print(f'  {group}.{name}.{key:<16} {old:>10} -> {value:<10} {change:+.1%} {mark}')
+                if mark == 'REGRESSION':
+                    regressions.append(f'{group}.{name}.{key}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.02, help='Задержка ответа mock-портала, сек')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='Время генерации mock-LLM, сек')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--min-time', type=float, default=1.0, help='Время замера каждого парсера, сек')
+    parser.add_argument('--adverts', type=int, default=20, help='Объявлений для замера get_full_zakup_info')
+    parser.add_argument('--no-memory', action='store_true', help='Не замерять пиковую память')
+    parser.add_argument('--parse-processes', type=int, default=0,
+                        help='GOSZAKUP_PARSE_PROCESSES для замеров fetch/reports (0 - парсинг в потоке задачи)')
+    parser.add_argument('--pipeline', choices=('async', 'threads'), default='async',
+                        help='Режим выполнения задач сервера (PIPELINE_MODE)')
+    parser.add_argument('--keep-llm-limits', action='store_true',
+                        help='Оставить лимиты RPM/TPM планировщика OpenAI (по умолчанию сняты, mock их не требует)')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.15)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    mock = MockServer(latency=args.latency, llm_latency=args.llm_latency, error_rate=args.error_rate).start()
+    os.environ.update(mock.env())
+    os.environ['GOSZAKUP_REQUEST_DELAY'] = '0'
+    os.environ['GOSZAKUP_PARSE_PROCESSES'] = str(args.parse_processes)
+    # the mock serves the same techspec for every advert: with reuse on, reports would skip the LLM
+    os.environ['TECHSPEC_REUSE_THRESHOLD'] = '2'
+    if not args.keep_llm_limits:
+        os.environ['OPENAI_RPM_LIMIT'] = str(10 ** 6)
+        os.environ['OPENAI_TPM_LIMIT'] = str(10 ** 12)
+
+    # reports/ and downloads/ are written relative to the working directory
+    baseline_path = os.path.abspath(args.baseline)
+    # no baseline is committed: timings depend on the machine, each one records its own
+    has_baseline = os.path.exists(baseline_path)
+    if not has_baseline and not args.save_baseline:
+        print(f'WARNING: no baseline at {baseline_path}, results will not be compared. '
+              f'Run with --save-baseline first (on the code you compare against).', file=sys.stderr)
+    os.chdir(tempfile.mkdtemp(prefix='tender-bench-'))
+    logging.disable(logging.INFO)
+
+    results = {}
+    print('Parsers:')
+    results['parsers'] = bench_parsers(args.min_time)
+    results['parse_pool'] = bench_parse_pool(args.min_time)
+    print('Techspec index:')
+    results['techspec_index'] = bench_techspec_index(args.min_time)
+    print('Fetch:')
+    results['fetch'] = {'get_full_zakup_info': bench_full_zakup_info(args.adverts)}
+    print(f'Reports ({args.pipeline} pipeline):')
+    results[f'reports_{args.pipeline}'] = bench_reports(not args.no_memory, args.pipeline)
+    mock.stop()
+
+    regressions = []
+    if args.save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+        print(f'\nBaseline saved to {baseline_path}')
+    elif has_baseline:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    else:
+        print(f'\nWARNING: nothing to compare with, {baseline_path} does not exist. '
+              f'Save one with: python -m benchmarks.run_benchmarks --save-baseline', file=sys.stderr)
+        if args.fail_on_regression:
+            # a regression check that checked nothing must not pass
+            sys.exit(2)
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
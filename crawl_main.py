@@ -0,0 +1,63 @@
+import argparse
+import json
+import logging
+import multiprocessing
+from src.crawl_coordinator import CrawlCoordinator, RateLimitedSession, run_worker, seed, new_worker_id, CRAWL_DB_PATH
+from src.goszakup_parser import GoszakupAdapter, get_access_token, headers
+from src.samryk_api import SamrukAdapter, headers as samruk_headers
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def make_adapter(source, coordinator):
+    """Адаптер источника, чьи запросы идут через общий для всех воркеров лимит на хост"""
+    session = RateLimitedSession(coordinator)
+    if source == 'goszakup':
+        session.headers.update(headers)
+        session.headers['X-Auth-Token'] = get_access_token(headers)
+        return GoszakupAdapter(session)
+    session.headers.update(samruk_headers)
+    return SamrukAdapter(session)
+
+
+def work(db_path, source, crawl):
+    coordinator = CrawlCoordinator(db_path)
+    return run_worker(coordinator, make_adapter(source, coordinator), crawl, new_worker_id())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Распределённый обход портала: страницы списка и объявления '
+                                                 'делятся на задания с арендой в общей SQLite-базе')
+    parser.add_argument('command', choices=('seed', 'work', 'status', 'export'),
+                        help='seed - создать задания по страницам списка, work - обрабатывать задания, '
+                             'status - сколько заданий в каждом состоянии, export - результаты в JSONL')
+    parser.add_argument('--source', choices=('goszakup', 'samruk'), default='goszakup')
+    parser.add_argument('--crawl', help='Имя обхода, по умолчанию - имя источника')
+    parser.add_argument('--db', default=CRAWL_DB_PATH, help='Путь к базе координатора')
+    parser.add_argument('--max-pages', type=int, help='Ограничить число страниц списка (seed)')
+    parser.add_argument('--processes', type=int, default=1, help='Воркеров на этой машине (work)')
+    parser.add_argument('--out', default='crawl_results.jsonl', help='Файл результатов (export)')
+    args = parser.parse_args()
+
+    crawl = args.crawl or args.source
+    coordinator = CrawlCoordinator(args.db)
+
+    if args.command == 'seed':
+        pages = seed(coordinator, make_adapter(args.source, coordinator), crawl, args.max_pages)
+        logging.info(f'{crawl}: {pages} страниц списка в очереди')
+    elif args.command == 'work':
+        if args.processes == 1:
+            work(args.db, args.source, crawl)
+        else:
+            with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+                done = pool.starmap(work, [(args.db, args.source, crawl)] * args.processes)
+            logging.info(f'{crawl}: обработано заданий по воркерам {done}')
+    elif args.command == 'status':
+        print(json.dumps(coordinator.counts(crawl), ensure_ascii=False, indent=4))
+    else:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            for _, tender in coordinator.results(crawl):
+                f.write(json.dumps(tender, ensure_ascii=False) + '\n')
+        logging.info(f'{crawl}: результаты сохранены в {args.out}')
@@ -1,146 +1,571 @@
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
+from quart import Quart, request, jsonify, send_from_directory, Response
+from quart_cors import cors
+import asyncio
+import collections
+import concurrent.futures
 import threading
 import json
 import os
 import logging
+import time
 from requests import Session
-from concurrent.futures import ThreadPoolExecutor
 from llm_prompts.prompts import affiliate_prompt, prompt_for_parsing_techspec
 from src.utils import clear_folder
-from src.openai_client import upload_files, get_response_from_gpt, get_client
-from src.goszakup_parser import get_access_token, get_full_zakup_info, download_techspec_files, headers
+from src.openai_client import (upload_files, aupload_files, submit_response_from_gpt, aget_response_from_gpt,
+                               get_client, get_scheduler_metrics)
+from src.goszakup_parser import (get_access_token, get_full_zakup_info, download_techspec_files, headers,
+                                 get_parse_executor, make_async_client, aget_access_token, aget_full_zakup_info,
+                                 adownload_techspec_files, run_parser, arun_parser)
+from src import metrics
+from src.profiling import maybe_profile, should_profile
+from src.deadlines import Deadline, TaskCancelled, section_statuses
+from src.techspec_index import get_techspec_index, techspec_signature, TECHSPEC_REUSE_THRESHOLD
 
-app = Flask(__name__)
-CORS(app)
+app = cors(Quart(__name__), allow_origin='*')
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 # Глобальный словарь для хранения статусов задач
 tasks_status = {}
+# task_id -> функция отмены выполняющейся задачи
+running_tasks = {}
 
 techspec_folder = os.path.join("downloads", "goskazup_techspecs")
 
-def parse_advert(advert_id):
-    """Основная функция парсинга объявления"""
-    task_id = str(advert_id)
-    tasks_status[task_id] = {
+# async - задачи выполняются корутинами в event loop сервера (httpx + AsyncOpenAI),
+# threads - прежний режим: поток на задачу, requests и синхронные вызовы
+PIPELINE_MODE = os.environ.get('PIPELINE_MODE', 'async')
+
+MODEL = "gpt-5-nano"
+
+# Частичный текст ответа GPT попадает в статус задачи по мере генерации
+STREAM_LLM_OUTPUT = os.environ.get('STREAM_LLM_OUTPUT', '1') == '1'
+
+# Разделы отчёта, которые просмотрщик подгружает отдельно от заголовка: списки - страницами, тексты - целиком
+LIST_SECTIONS = ('lots_info', 'techspec_files')
+TEXT_SECTIONS = ('techspec_analyzed', 'affiliate_analysis')
+MAX_PAGE_SIZE = 500
+# Сколько разобранных отчётов держать в памяти, чтобы страницы лотов не перечитывали JSON с диска
+REPORT_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_SIZE', 16))
+# filename -> (mtime_ns, отчёт)
+_report_cache = collections.OrderedDict()
+_report_cache_lock = threading.Lock()
+
+# Сколько отчёт считается свежим, по группам полей: метаданные объявления (статус, заявки, лоты) меняются
+# часто, анализы GPT зависят только от техспецификаций
+REPORT_TTL = {
+    'metadata': float(os.environ.get('REPORT_TTL_METADATA', 3600)),
+    'analyses': float(os.environ.get('REPORT_TTL_ANALYSES', 7 * 24 * 3600)),
+}
+# группа -> разделы отчёта (ключи section_statuses)
+FIELD_GROUPS = {
+    'metadata': ('advert', 'lots_info', 'techspec_files'),
+    'analyses': ('techspec_analyzed', 'affiliate_analysis'),
+}
+# advert_id -> вычисляемый ответ /api/parse: одновременные запросы одного объявления получают один ответ
+# и запускают не больше одной задачи (singleflight)
+_parse_inflight = {}
+
+
+def make_partial_writer(task_id, key):
+    """Callback, дописывающий поток токенов в tasks_status[task_id]['partial'][key]"""
+    if not STREAM_LLM_OUTPUT:
+        return None
+    partial = tasks_status[task_id]['partial']
+    partial[key] = ''
+
+    def on_delta(text):
+        # None: повторный запрос, текст начинается заново
+        partial[key] = '' if text is None else partial[key] + text
+
+    return on_delta
+
+
+def new_task_status():
+    return {
         'status': 'running',
         'progress': 0,
         'message': 'Инициализация...',
         'result': None,
-        'error': None
+        'error': None,
+        'partial': {},
+        'trace': None,
+        'profile': None,
+        'sections': None
     }
-    
+
+
+def llm_requests(task_id, file_ids):
+    """Ключ отчёта -> параметры запроса к GPT; запросы идут через общий клиент и планировщик лимитов OpenAI"""
+    return {
+        "techspec_analyzed": dict(
+            input_text=prompt_for_parsing_techspec,
+            file_ids=file_ids,
+            model=MODEL,
+            enable_web_search=False,
+            label="Techspec",
+            task_key=task_id,
+            on_delta=make_partial_writer(task_id, "techspec_analyzed")
+        ),
+        "affiliate_analysis": dict(
+            input_text=affiliate_prompt,
+            file_ids=file_ids,
+            model=MODEL,
+            enable_web_search=False,
+            label="Affiliate",
+            task_key=task_id,
+            on_delta=make_partial_writer(task_id, "affiliate_analysis")
+        ),
+    }
+
+
+def save_report(task_id, advert_id, result, reason=None):
+    """Сохраняет отчёт; при reason (timeout / cancelled / error) - частичный, с флагами готовности разделов"""
+    if reason and not result:
+        # сохранять нечего
+        tasks_status[task_id]['status'] = 'cancelled' if reason == 'cancelled' else 'error'
+        tasks_status[task_id]['error'] = None if reason == 'cancelled' else 'Превышен лимит времени'
+        tasks_status[task_id]['message'] = 'Задача отменена' if reason == 'cancelled' else 'Превышен лимит времени'
+        return
+    tasks_status[task_id]['progress'] = 95
+    tasks_status[task_id]['message'] = 'Сохраняю результат...'
+    sections = section_statuses(result, reason)
+    # время получения групп полей; группы, перенесённые из прошлого отчёта, сохраняют своё время
+    now = time.time()
+    fetched_at = dict(result.get('fetched_at') or {})
+    for group, keys in FIELD_GROUPS.items():
+        if group not in fetched_at and all(sections[key] == 'ok' for key in keys):
+            fetched_at[group] = now
+    report = {
+        **result,
+        'fetched_at': fetched_at,
+        'report_status': 'complete' if all(v == 'ok' for v in sections.values()) else 'partial',
+        'sections': sections,
+    }
+    os.makedirs('reports', exist_ok=True)
+    report_path = os.path.join('reports', f'goszakup_{advert_id}.json')
+    # через временный файл: прошлая версия отчёта отдаётся, пока задача его обновляет
+    tmp_path = f'{report_path}.{task_id}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, report_path)
+
+    tasks_status[task_id]['progress'] = 100
+    tasks_status[task_id]['result'] = f'goszakup_{advert_id}.json'
+    tasks_status[task_id]['sections'] = sections
+    tasks_status[task_id]['partial'] = {}
+    if reason == 'cancelled':
+        tasks_status[task_id]['status'] = 'cancelled'
+        tasks_status[task_id]['message'] = 'Задача отменена, сохранён частичный отчёт'
+    elif reason == 'timeout':
+        tasks_status[task_id]['status'] = 'completed'
+        tasks_status[task_id]['message'] = 'Превышен лимит времени, сохранён частичный отчёт'
+    else:
+        tasks_status[task_id]['status'] = 'completed'
+        tasks_status[task_id]['message'] = 'Отчёт успешно сформирован!'
+
+
+def fail_task(task_id, advert_id, e, result=None):
+    logger.error(f"Error parsing advert {advert_id}: {e}", exc_info=True)
+    if result:
+        # уже собранные разделы не теряем
+        save_report(task_id, advert_id, result, reason='error')
+    tasks_status[task_id]['status'] = 'error'
+    tasks_status[task_id]['error'] = str(e)
+    tasks_status[task_id]['message'] = f'Ошибка: {str(e)}'
+
+
+def reusable_analyses(advert_id):
+    """Анализы GPT из отчёта объявления, если они есть и без ошибок"""
     try:
-        # Получаем токен
-        tasks_status[task_id]['progress'] = 5
-        tasks_status[task_id]['message'] = 'Получение токена доступа...'
-        token = get_access_token(headers)
-        session_headers = headers.copy()
-        session_headers['X-Auth-Token'] = token
-        
-        session = Session()
-        session.headers.update(session_headers)
+        report = load_report(f'goszakup_{advert_id}.json')
+    except (OSError, json.JSONDecodeError):
+        return None
+    analyses = {key: report.get(key) for key in TEXT_SECTIONS}
+    if all(isinstance(text, str) and text and not text.startswith('Error:') for text in analyses.values()):
+        return analyses
+    return None
+
+
+def lookup_similar_tenders(task_id, advert_id, signature, result):
+    """Похожие техспецификации прошлых отчётов в result['similar_tenders'].
+
+    Если одна из них почти совпадает (TECHSPEC_REUSE_THRESHOLD) и её отчёт полный, её анализы копируются
+    в result и возвращается True: загрузка в OpenAI и запросы к GPT не нужны.
+    """
+    tasks_status[task_id]['message'] = 'Ищу похожие техспецификации...'
+    with metrics.span('techspec_similarity'):
+        matches = get_techspec_index().query(signature, exclude=advert_id)
+        result['similar_tenders'] = matches
+        for match in matches:
+            if match['jaccard'] < TECHSPEC_REUSE_THRESHOLD:
+                break
+            analyses = reusable_analyses(match['advert_id'])
+            if analyses:
+                result.update(analyses)
+                result['analysis_reused_from'] = {'advert_id': match['advert_id'], 'jaccard': match['jaccard']}
+                metrics.set_attrs(reused_from=match['advert_id'])
+                logger.info(f"Advert {advert_id}: reusing analyses of {match['advert_id']} (jaccard {match['jaccard']})")
+                return True
+        return False
+
+
+def index_techspec(advert_id, signature, result):
+    """Добавляет техспецификацию отчёта в индекс похожих; ошибка индекса не должна ронять задачу"""
+    if signature is None:
+        return
+    try:
+        get_techspec_index().add(
+            advert_id, signature,
+            organizer_bin=result.get('organizer_bin'),
+            organizer_name=result.get('organizer_name'),
+            tender_name=result.get('tender_name'),
+        )
+    except Exception as e:
+        logger.error(f"Failed to index techspec of advert {advert_id}: {e}", exc_info=True)
+
+
+def stale_groups(report, default_fetched_at):
+    """Группы полей отчёта, которые нужно обновить: старше REPORT_TTL или не готовы в частичном отчёте.
+
+    Для отчётов без fetched_at (сохранённых до его появления) время берётся из default_fetched_at.
+    """
+    now = time.time()
+    fetched_at = report.get('fetched_at') or {}
+    sections = report.get('sections') or section_statuses(report)
+    stale = []
+    for group, keys in FIELD_GROUPS.items():
+        if now - fetched_at.get(group, default_fetched_at) > REPORT_TTL[group] \
+                or any(sections.get(key) != 'ok' for key in keys):
+            stale.append(group)
+    return stale
+
+
+def keep_previous_analyses(previous, result):
+    """Если техспецификации не изменились, переносит анализы прошлого отчёта в result и возвращает True"""
+    def techspec_key(report):
+        return sorted((f.get('lot_id'), f.get('file_name')) for f in report.get('techspec_files') or [])
+
+    if techspec_key(previous) != techspec_key(result):
+        return False
+    for key in (*TEXT_SECTIONS, 'similar_tenders', 'analysis_reused_from'):
+        if key in previous:
+            result[key] = previous[key]
+    analyses_fetched_at = (previous.get('fetched_at') or {}).get('analyses')
+    if analyses_fetched_at is not None:
+        result['fetched_at'] = {'analyses': analyses_fetched_at}
+    return True
+
+
+def prepare_advert_folder(task_id):
+    # своя папка у каждого объявления, чтобы параллельные задачи не смешивали файлы
+    tasks_status[task_id]['progress'] = 30
+    tasks_status[task_id]['message'] = 'Очищаю папку с техспецификациями...'
+    advert_folder = os.path.join(techspec_folder, task_id)
+    os.makedirs(advert_folder, exist_ok=True)
+    clear_folder(advert_folder)
+    return advert_folder
+
+
+def parse_advert(advert_id, deadline=None, previous=None):
+    """Основная функция парсинга объявления (режим threads).
+
+    previous - прошлый отчёт со свежими анализами: если техспецификации не изменились, обновляются только метаданные.
+    """
+    task_id = str(advert_id)
+    tasks_status[task_id] = new_task_status()
+    deadline = deadline or Deadline()
+    result = {}
+    futures = {}
+    signature = None
+    
+    # Дерево вложенных этапов задачи (goszakup, загрузки, OpenAI) с длительностями, отдаётся в /api/status
+    with metrics.start_trace('parse_advert', advert_id=task_id) as trace:
+        tasks_status[task_id]['trace'] = trace
+        try:
+            # Получаем токен
+            deadline.start_stage('fetch')
+            tasks_status[task_id]['progress'] = 5
+            tasks_status[task_id]['message'] = 'Получение токена доступа...'
+            token = get_access_token(headers)
+            session_headers = headers.copy()
+            session_headers['X-Auth-Token'] = token
         
-        # Собираем информацию
-        tasks_status[task_id]['progress'] = 15
-        tasks_status[task_id]['message'] = 'Собираю полную информацию по закупке...'
-        result = get_full_zakup_info(session, advert_id)
+            session = Session()
+            session.headers.update(session_headers)
         
-        # Очищаем папку
-        tasks_status[task_id]['progress'] = 30
-        tasks_status[task_id]['message'] = 'Очищаю папку с техспецификациями...'
-        os.makedirs(techspec_folder, exist_ok=True)
-        clear_folder(techspec_folder)
+            # Собираем информацию
+            tasks_status[task_id]['progress'] = 15
+            tasks_status[task_id]['message'] = 'Собираю полную информацию по закупке...'
+            get_full_zakup_info(session, advert_id, result)
+            deadline.check()
+
+            if previous is not None and keep_previous_analyses(previous, result):
+                save_report(task_id, advert_id, result)
+                return
         
-        # Загружаем техспецификации
-        tasks_status[task_id]['progress'] = 40
-        tasks_status[task_id]['message'] = 'Загружаю техспецификации...'
-        download_techspec_files(session, result['techspec_files'], techspec_folder)
+            # Очищаем папку
+            advert_folder = prepare_advert_folder(task_id)
         
-        files = os.listdir(techspec_folder)
+            # Загружаем техспецификации
+            deadline.start_stage('download')
+            tasks_status[task_id]['progress'] = 40
+            tasks_status[task_id]['message'] = 'Загружаю техспецификации...'
+            download_techspec_files(session, result['techspec_files'], advert_folder)
+            deadline.check()
         
-        if len(files) > 3:
-            raise Exception('Too many files to upload!')
+            files = os.listdir(advert_folder)
         
-        # Загружаем файлы в OpenAI
-        tasks_status[task_id]['progress'] = 50
-        tasks_status[task_id]['message'] = 'Загружаю файлы в OpenAI...'
-        techspec_file_ids_in_openai = []
-        client = get_client()
+            if len(files) > 3:
+                raise Exception('Too many files to upload!')
+
+            # Почти такая же техспецификация уже анализировалась - берём её анализы вместо GPT
+            signature = run_parser(techspec_signature, [os.path.join(advert_folder, f) for f in files])
+            if signature and lookup_similar_tenders(task_id, advert_id, signature, result):
+                save_report(task_id, advert_id, result)
+                return
         
-        for i, file_name in enumerate(files):
-            progress = 50 + int((i + 1) / len(files) * 20)
-            tasks_status[task_id]['progress'] = progress
-            tasks_status[task_id]['message'] = f'Выгружаю файл в OpenAI ({i+1}/{len(files)}): {file_name}'
-            upload_metadata = upload_files(client, os.path.join(techspec_folder, file_name))
-            techspec_file_ids_in_openai.append(upload_metadata)
+            # Загружаем файлы в OpenAI
+            deadline.start_stage('upload')
+            tasks_status[task_id]['progress'] = 50
+            tasks_status[task_id]['message'] = 'Загружаю файлы в OpenAI...'
+            techspec_file_ids_in_openai = []
+            client = get_client()
         
-        # Анализ через GPT
-        tasks_status[task_id]['progress'] = 70
-        tasks_status[task_id]['message'] = 'Анализирую через GPT (техспецификация)...'
-        MODEL = "gpt-5-nano"
+            for i, file_name in enumerate(files):
+                progress = 50 + int((i + 1) / len(files) * 20)
+                tasks_status[task_id]['progress'] = progress
+                tasks_status[task_id]['message'] = f'Выгружаю файл в OpenAI ({i+1}/{len(files)}): {file_name}'
+                upload_metadata = upload_files(client, os.path.join(advert_folder, file_name))
+                techspec_file_ids_in_openai.append(upload_metadata)
+                deadline.check()
         
-        with ThreadPoolExecutor() as executor:
+            # Анализ через GPT
+            deadline.start_stage('analysis')
+            tasks_status[task_id]['progress'] = 70
+            tasks_status[task_id]['message'] = 'Анализирую через GPT (техспецификация)...'
             futures = {
-                executor.submit(
-                    get_response_from_gpt,
-                    client=client,
-                    input_text=prompt_for_parsing_techspec,
-                    file_ids=techspec_file_ids_in_openai,
-                    model=MODEL,
-                    enable_web_search=False,
-                    label="Techspec"
-                ): "techspec_analyzed",
-                executor.submit(
-                    get_response_from_gpt,
-                    client=client,
-                    input_text=affiliate_prompt,
-                    file_ids=techspec_file_ids_in_openai,
-                    model=MODEL,
-                    enable_web_search=False,
-                    label="Affiliate"
-                ): "affiliate_analysis"
+                submit_response_from_gpt(**params): key
+                for key, params in llm_requests(task_id, techspec_file_ids_in_openai).items()
             }
-            
+
             completed = 0
             total = len(futures)
             for future in futures:
                 key = futures[future]
-                try:
-                    tasks_status[task_id]['message'] = f'Анализирую через GPT ({key})...'
-                    result[key] = future.result()
-                    completed += 1
-                    tasks_status[task_id]['progress'] = 70 + int(completed / total * 25)
-                except Exception as e:
-                    result[key] = f"Error: {e}"
+                tasks_status[task_id]['message'] = f'Анализирую через GPT ({key})...'
+                while True:
+                    # короткие ожидания, чтобы между ними проверять дедлайн и отмену
+                    deadline.check()
+                    try:
+                        result[key] = future.result(timeout=min(0.5, deadline.stage_remaining() + 0.01))
+                        completed += 1
+                        tasks_status[task_id]['progress'] = 70 + int(completed / total * 25)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        continue
+                    except Exception as e:
+                        result[key] = f"Error: {e}"
+                        break
         
-        # Сохраняем результат
-        tasks_status[task_id]['progress'] = 95
-        tasks_status[task_id]['message'] = 'Сохраняю результат...'
-        os.makedirs('reports', exist_ok=True)
-        report_path = os.path.join('reports', f'goszakup_{advert_id}.json')
-        with open(report_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=4)
+            # Сохраняем результат
+            save_report(task_id, advert_id, result)
         
-        tasks_status[task_id]['status'] = 'completed'
-        tasks_status[task_id]['progress'] = 100
-        tasks_status[task_id]['message'] = 'Отчёт успешно сформирован!'
-        tasks_status[task_id]['result'] = f'goszakup_{advert_id}.json'
-        
-    except Exception as e:
-        logger.error(f"Error parsing advert {advert_id}: {e}", exc_info=True)
-        tasks_status[task_id]['status'] = 'error'
-        tasks_status[task_id]['error'] = str(e)
-        tasks_status[task_id]['message'] = f'Ошибка: {str(e)}'
+        except TaskCancelled:
+            save_report(task_id, advert_id, result, reason='cancelled')
+        except TimeoutError as e:
+            logger.warning(f"Advert {advert_id}: {e}")
+            save_report(task_id, advert_id, result, reason='timeout')
+        except Exception as e:
+            fail_task(task_id, advert_id, e, result)
+        finally:
+            # отмена future доходит до запроса в event loop клиента OpenAI
+            for future in futures:
+                future.cancel()
+            index_techspec(advert_id, signature, result)
+
+
+async def aparse_advert(advert_id, deadline=None, previous=None):
+    """parse_advert на asyncio (режим async): те же этапы и тот же отчёт, но без потока на задачу.
+
+    Этапы ограничены asyncio.timeout, отмена задачи прерывает текущие запросы к порталу и OpenAI.
+    """
+    task_id = str(advert_id)
+    tasks_status[task_id] = new_task_status()
+    deadline = deadline or Deadline()
+    result = {}
+    signature = None
+
+    with metrics.start_trace('parse_advert', advert_id=task_id) as trace:
+        tasks_status[task_id]['trace'] = trace
+        try:
+            async with make_async_client() as http_client:
+                async with asyncio.timeout(deadline.start_stage('fetch')):
+                    # Получаем токен
+                    tasks_status[task_id]['progress'] = 5
+                    tasks_status[task_id]['message'] = 'Получение токена доступа...'
+                    http_client.headers['X-Auth-Token'] = await aget_access_token(http_client, headers)
+
+                    # Собираем информацию
+                    tasks_status[task_id]['progress'] = 15
+                    tasks_status[task_id]['message'] = 'Собираю полную информацию по закупке...'
+                    await aget_full_zakup_info(http_client, advert_id, result)
+
+                if previous is not None and keep_previous_analyses(previous, result):
+                    save_report(task_id, advert_id, result)
+                    return
+
+                # Очищаем папку
+                advert_folder = prepare_advert_folder(task_id)
+
+                # Загружаем техспецификации
+                async with asyncio.timeout(deadline.start_stage('download')):
+                    tasks_status[task_id]['progress'] = 40
+                    tasks_status[task_id]['message'] = 'Загружаю техспецификации...'
+                    await adownload_techspec_files(http_client, result['techspec_files'], advert_folder)
+
+            files = os.listdir(advert_folder)
+
+            if len(files) > 3:
+                raise Exception('Too many files to upload!')
+
+            # Почти такая же техспецификация уже анализировалась - берём её анализы вместо GPT
+            signature = await arun_parser(techspec_signature, [os.path.join(advert_folder, f) for f in files])
+            if signature and lookup_similar_tenders(task_id, advert_id, signature, result):
+                save_report(task_id, advert_id, result)
+                return
+
+            # Загружаем файлы в OpenAI
+            techspec_file_ids_in_openai = []
+            async with asyncio.timeout(deadline.start_stage('upload')):
+                tasks_status[task_id]['progress'] = 50
+                tasks_status[task_id]['message'] = 'Загружаю файлы в OpenAI...'
+
+                for i, file_name in enumerate(files):
+                    tasks_status[task_id]['progress'] = 50 + int((i + 1) / len(files) * 20)
+                    tasks_status[task_id]['message'] = f'Выгружаю файл в OpenAI ({i+1}/{len(files)}): {file_name}'
+                    techspec_file_ids_in_openai.append(await aupload_files(os.path.join(advert_folder, file_name)))
+
+            # Анализ через GPT
+            tasks_status[task_id]['progress'] = 70
+            tasks_status[task_id]['message'] = 'Анализирую через GPT (техспецификация)...'
+            analyses = {
+                key: asyncio.ensure_future(aget_response_from_gpt(**params))
+                for key, params in llm_requests(task_id, techspec_file_ids_in_openai).items()
+            }
+
+            try:
+                async with asyncio.timeout(deadline.start_stage('analysis')):
+                    completed = 0
+                    total = len(analyses)
+                    for key, analysis in analyses.items():
+                        try:
+                            tasks_status[task_id]['message'] = f'Анализирую через GPT ({key})...'
+                            result[key] = await analysis
+                            completed += 1
+                            tasks_status[task_id]['progress'] = 70 + int(completed / total * 25)
+                        except Exception as e:
+                            result[key] = f"Error: {e}"
+            finally:
+                for analysis in analyses.values():
+                    analysis.cancel()
+
+            # Сохраняем результат
+            save_report(task_id, advert_id, result)
+
+        except asyncio.CancelledError:
+            save_report(task_id, advert_id, result, reason='cancelled')
+        except TimeoutError:
+            logger.warning(f"Advert {advert_id}: stage {deadline.stage} exceeded its deadline")
+            save_report(task_id, advert_id, result, reason='timeout')
+        except Exception as e:
+            fail_task(task_id, advert_id, e, result)
+        finally:
+            index_techspec(advert_id, signature, result)
+
+
+def run_task(advert_id, profile=False, deadline=None, previous=None):
+    """parse_advert в потоке; с profile=True - под профилировщиком"""
+    try:
+        with maybe_profile(f'goszakup_{advert_id}', profile) as profile_files:
+            parse_advert(advert_id, deadline, previous)
+        if profile_files:
+            tasks_status[str(advert_id)]['profile'] = profile_files
+    finally:
+        running_tasks.pop(str(advert_id), None)
+
+
+def start_task(advert_id, profile=False, previous=None):
+    task_id = str(advert_id)
+    # статус выставляется до запуска, чтобы первый опрос /api/status не увидел прошлую завершённую задачу
+    tasks_status[task_id] = new_task_status()
+    deadline = Deadline()
+    if PIPELINE_MODE == 'async' and not profile:
+        # Задача - корутина в event loop сервера
+        task = asyncio.get_running_loop().create_task(aparse_advert(advert_id, deadline, previous))
+        running_tasks[task_id] = task.cancel
+        task.add_done_callback(lambda _: running_tasks.pop(task_id, None))
+    else:
+        # Запускаем парсинг в отдельном потоке; профилируемые задачи тоже идут сюда,
+        # чтобы сэмплер видел стек только этой задачи
+        running_tasks[task_id] = deadline.cancel
+        thread = threading.Thread(target=run_task, args=(advert_id, profile, deadline, previous))
+        thread.daemon = True
+        thread.start()
+
+
+async def start_or_reuse(advert_id, force=False, profile=False):
+    """Ответ /api/parse: выполняющаяся задача, свежий отчёт или новая задача.
+
+    Устаревший отчёт отдаётся сразу (result) и обновляется в фоне (refreshing); если устарели только
+    метаданные, задача перечитывает объявление и сохраняет анализы прошлого отчёта.
+    """
+    task_id = str(advert_id)
+
+    report_file = f'goszakup_{advert_id}.json'
+
+    # Если задача уже выполняется, возвращаем её статус и прошлую версию отчёта, если она есть;
+    # force к ней не применяется - клиент узнаёт об этом из force_applied
+    if task_id in running_tasks:
+        response = {'task_id': task_id, 'message': 'Task already running', 'refreshing': True}
+        if force:
+            response['force_applied'] = False
+        if os.path.exists(os.path.join('reports', report_file)):
+            response['result'] = report_file
+        return response
+
+    previous = None
+    if not force and not profile:
+        try:
+            previous = await asyncio.to_thread(load_report, report_file)
+            report_mtime = os.path.getmtime(os.path.join('reports', report_file))
+        except (OSError, json.JSONDecodeError):
+            previous = None
+
+    # сэмплирование PROFILE_SAMPLE_RATE решается только для запускаемой задачи: выбранный случайно
+    # запрос не должен пропускать свежий отчёт, как явный profile
+    if previous is None:
+        start_task(advert_id, should_profile(profile))
+        return {'task_id': task_id, 'message': 'Parsing started', 'refreshing': False}
+
+    stale = stale_groups(previous, report_mtime)
+    if not stale:
+        # статус для тех, кто опрашивает /api/status по этому task_id
+        tasks_status[task_id] = {**new_task_status(), 'status': 'completed', 'progress': 100,
+                                 'message': 'Отчёт актуален', 'result': report_file,
+                                 'sections': previous.get('sections')}
+        return {'task_id': task_id, 'message': 'Report is fresh', 'result': report_file, 'refreshing': False}
+
+    start_task(advert_id, should_profile(False), previous=previous if stale == ['metadata'] else None)
+    return {'task_id': task_id, 'message': 'Refreshing stale report', 'result': report_file,
+            'refreshing': True, 'stale': stale}
 
 
 @app.route('/api/parse', methods=['POST'])
-def start_parsing():
-    """Запуск парсинга объявления"""
-    data = request.json
+async def start_parsing():
+    """Запуск парсинга объявления; force=true - заново, даже если сохранённый отчёт свежий"""
+    data = await request.get_json()
     advert_id = data.get('advert_id')
     
     if not advert_id:
@@ -152,33 +577,60 @@ def start_parsing():
         return jsonify({'error': 'advert_id must be a number'}), 400
     
     task_id = str(advert_id)
-    
-    # Если задача уже выполняется, возвращаем её статус
-    if task_id in tasks_status and tasks_status[task_id]['status'] == 'running':
-        return jsonify({'task_id': task_id, 'message': 'Task already running'}), 200
-    
-    # Запускаем парсинг в отдельном потоке
-    thread = threading.Thread(target=parse_advert, args=(advert_id,))
-    thread.daemon = True
-    thread.start()
-    
-    return jsonify({
-        'task_id': task_id,
-        'message': 'Parsing started'
-    }), 200
+
+    # Одновременные запросы одного объявления ждут один и тот же ответ
+    inflight = _parse_inflight.get(task_id)
+    if inflight is None:
+        inflight = asyncio.ensure_future(
+            start_or_reuse(advert_id, bool(data.get('force')), bool(data.get('profile'))))
+        _parse_inflight[task_id] = inflight
+        inflight.add_done_callback(lambda _: _parse_inflight.pop(task_id, None))
+
+    # shield: отключившийся клиент не отменяет ответ для остальных
+    return jsonify(await asyncio.shield(inflight)), 200
+
+
+@app.route('/api/parse/<task_id>', methods=['DELETE'])
+async def cancel_parsing(task_id):
+    """Отмена задачи: уже собранные разделы сохраняются как частичный отчёт"""
+    if task_id not in tasks_status:
+        return jsonify({'error': 'Task not found'}), 404
+
+    cancel = running_tasks.get(task_id)
+    if cancel is None:
+        return jsonify({'error': 'Task is not running'}), 409
+
+    cancel()
+    return jsonify({'task_id': task_id, 'message': 'Cancelling'}), 202
 
 
 @app.route('/api/status/<task_id>', methods=['GET'])
-def get_status(task_id):
+async def get_status(task_id):
     """Получение статуса задачи"""
     if task_id not in tasks_status:
         return jsonify({'error': 'Task not found'}), 404
     
-    return jsonify(tasks_status[task_id]), 200
+    status = dict(tasks_status[task_id])
+    if status['trace'] is not None:
+        status['trace'] = metrics.snapshot(status['trace'])
+    return jsonify(status), 200
+
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    """Метрики этапов, HTTP, ретраев и токенов в формате Prometheus"""
+    body, content_type = metrics.export()
+    return Response(body, content_type=content_type)
+
+
+@app.route('/api/llm/metrics', methods=['GET'])
+async def llm_metrics():
+    """Очередь и лимиты запросов к OpenAI"""
+    return jsonify(get_scheduler_metrics()), 200
 
 
 @app.route('/api/reports', methods=['GET'])
-def list_reports():
+async def list_reports():
     """Список доступных отчётов"""
     reports_dir = 'reports'
     if not os.path.exists(reports_dir):
@@ -188,18 +640,89 @@ def list_reports():
     return jsonify({'reports': reports}), 200
 
 
+def load_report(filename):
+    """Разобранный отчёт из reports/ с LRU-кэшем; перезаписанный файл (новый mtime) читается заново"""
+    path = os.path.join('reports', filename)
+    mtime = os.stat(path).st_mtime_ns
+    with _report_cache_lock:
+        cached = _report_cache.get(filename)
+        if cached and cached[0] == mtime:
+            _report_cache.move_to_end(filename)
+            return cached[1]
+
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+
+    with _report_cache_lock:
+        _report_cache[filename] = (mtime, report)
+        _report_cache.move_to_end(filename)
+        while len(_report_cache) > REPORT_CACHE_SIZE:
+            _report_cache.popitem(last=False)
+    return report
+
+
+def report_header(report):
+    """Отчёт без длинных разделов; вместо них - размеры, по которым просмотрщик решает, что и когда подгружать"""
+    header = {k: v for k, v in report.items() if k not in LIST_SECTIONS and k not in TEXT_SECTIONS}
+    header['section_sizes'] = {
+        **{key: len(report[key]) for key in LIST_SECTIONS if report.get(key)},
+        **{key: len(report[key]) for key in TEXT_SECTIONS if report.get(key)},
+    }
+    return header
+
+
+@app.route('/api/reports/<filename>/<section>', methods=['GET'])
+async def get_report_section(filename, section):
+    """Раздел отчёта: header, страница lots_info / techspec_files (?offset=&limit=) или текст анализа"""
+    if os.path.basename(filename) != filename or not filename.endswith('.json'):
+        return jsonify({'error': 'Report not found'}), 404
+    try:
+        report = await asyncio.to_thread(load_report, filename)
+    except FileNotFoundError:
+        return jsonify({'error': 'Report not found'}), 404
+
+    if section == 'header':
+        return jsonify(report_header(report)), 200
+
+    if section in LIST_SECTIONS:
+        items = report.get(section) or []
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_PAGE_SIZE)
+        return jsonify({
+            'section': section,
+            'total': len(items),
+            'offset': offset,
+            'items': items[offset:offset + limit]
+        }), 200
+
+    if section in TEXT_SECTIONS:
+        return jsonify({'section': section, 'text': report.get(section)}), 200
+
+    return jsonify({'error': 'Unknown section'}), 404
+
+
 @app.route('/reports/<filename>')
-def serve_report(filename):
+async def serve_report(filename):
     """Отдача JSON файлов из папки reports"""
-    return send_from_directory('reports', filename)
+    return await send_from_directory('reports', filename)
+
+
+@app.route('/profiles/<filename>')
+async def download_profile(filename):
+    """Скачивание профиля задачи (.folded для flamegraph/speedscope, .prof, .txt с топом функций)"""
+    if '.profile.' not in filename:
+        return jsonify({'error': 'Not a profile'}), 404
+    return await send_from_directory('reports', filename, as_attachment=True)
 
 
 @app.route('/')
-def index():
+async def index():
     """Главная страница - отдаём HTML"""
-    return send_from_directory('.', 'report_viewer.html')
+    return await send_from_directory('.', 'report_viewer.html')
 
 
 if __name__ == '__main__':
+    # Пул процессов для парсинга HTML (GOSZAKUP_PARSE_PROCESSES) поднимается заранее
+    get_parse_executor()
     app.run(debug=True, port=5000)
 
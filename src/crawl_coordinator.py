@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict
+from urllib.parse import urlsplit
+from requests import Session
+
+logger = logging.getLogger(__name__)
+
+# Crawl work shared by several worker processes (or hosts with a common filesystem) through one SQLite file
+CRAWL_DB_PATH = os.environ.get('CRAWL_DB_PATH', os.path.join('crawl', 'coordinator.sqlite3'))
+# a unit whose worker stopped heartbeating for this long goes back to the queue
+LEASE_SECONDS = float(os.environ.get('CRAWL_LEASE_SECONDS', 60))
+MAX_ATTEMPTS = int(os.environ.get('CRAWL_MAX_ATTEMPTS', 3))
+# a released (failed) unit waits attempts * this before it is claimed again, so a portal outage
+# does not burn all attempts within seconds
+RETRY_DELAY = float(os.environ.get('CRAWL_RETRY_DELAY', 30))
+# requests per second to one host, summed over all workers
+RATE_PER_HOST = float(os.environ.get('CRAWL_RATE_PER_HOST', 2))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS units (
+    unit_id TEXT PRIMARY KEY,
+    crawl TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    item TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL,
+    error TEXT,
+    result TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS units_claim ON units (crawl, status, lease_expires);
+CREATE TABLE IF NOT EXISTS host_slots (
+    host TEXT PRIMARY KEY,
+    next_at REAL NOT NULL
+);
+'''
+
+
+def new_worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+
+
+class CrawlCoordinator:
+    """Work units (listing pages, adverts) of named crawls, leased to workers.
+
+    A unit is claimed with a lease, kept alive by heartbeats and completed or released by its owner;
+    expired leases are claimed again by other workers. Units are keyed by crawl/kind/item, so seeding
+    twice and completing twice are no-ops: the first result of a unit is kept.
+    """
+
+    def __init__(self, path=CRAWL_DB_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS,
+                 retry_delay=RETRY_DELAY):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            # databases created before the retry backoff
+            if 'not_before' not in {row['name'] for row in db.execute('PRAGMA table_info(units)')}:
+                db.execute('ALTER TABLE units ADD COLUMN not_before REAL')
+
+    @contextmanager
+    def _connect(self):
+        # a connection per operation: workers are processes and threads, sqlite3 connections are not shareable
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction; BEGIN IMMEDIATE takes the write lock up front, so concurrent claims serialize"""
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def _insert_units(db, crawl, kind, items):
+        now = time.time()
+        db.executemany(
+            'INSERT OR IGNORE INTO units (unit_id, crawl, kind, item, updated_at) VALUES (?, ?, ?, ?, ?)',
+            [(f'{crawl}/{kind}/{item}', crawl, kind, str(item), now) for item in items],
+        )
+
+    def add_units(self, crawl, kind, items):
+        with self._transaction() as db:
+            self._insert_units(db, crawl, kind, items)
+
+    def claim(self, crawl, worker_id, limit=1):
+        """Leases up to `limit` pending or expired units to the worker.
+
+        Released units wait until their not_before. Listing pages go first (they add the adverts), then expired
+        leases, so a dead worker's units don't wait for the end of the crawl.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            # a unit that keeps outliving its worker (crashes it, hangs) stops being handed out
+            db.execute(
+                '''UPDATE units SET status = 'failed', owner = NULL, error = 'lease expired', updated_at = ?
+                   WHERE crawl = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?''',
+                (now, crawl, now, self.max_attempts),
+            )
+            rows = db.execute(
+                '''SELECT unit_id, kind, item, attempts FROM units
+                   WHERE crawl = ? AND ((status = 'pending' AND (not_before IS NULL OR not_before <= ?))
+                                        OR (status = 'leased' AND lease_expires < ?))
+                   ORDER BY kind = 'advert', status = 'pending', updated_at LIMIT ?''',
+                (crawl, now, now, limit),
+            ).fetchall()
+            db.executemany(
+                '''UPDATE units SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1,
+                   updated_at = ? WHERE unit_id = ?''',
+                [(worker_id, now + self.lease_seconds, now, row['unit_id']) for row in rows],
+            )
+        return [dict(row, attempts=row['attempts'] + 1) for row in rows]
+
+    def heartbeat(self, worker_id):
+        """Extends the leases of every unit the worker holds, returns how many it still holds"""
+        now = time.time()
+        with self._transaction() as db:
+            return db.execute(
+                "UPDATE units SET lease_expires = ? WHERE owner = ? AND status = 'leased'",
+                (now + self.lease_seconds, worker_id),
+            ).rowcount
+
+    def complete(self, unit_id, worker_id, result, follow_ups=()):
+        """Stores the result and adds follow-up units ((kind, items) pairs) in one transaction.
+
+        Returns False if the unit was already done, e.g. by a worker that reclaimed an expired lease.
+        """
+        with self._transaction() as db:
+            row = db.execute('SELECT crawl, status, owner FROM units WHERE unit_id = ?', (unit_id,)).fetchone()
+            if row is None or row['status'] == 'done':
+                return False
+            if row['owner'] != worker_id:
+                logger.info(f'{unit_id}: completed by {worker_id} after its lease passed to {row["owner"]}')
+            db.execute(
+                "UPDATE units SET status = 'done', owner = ?, result = ?, error = NULL, updated_at = ? "
+                "WHERE unit_id = ?",
+                (worker_id, json.dumps(result, ensure_ascii=False), time.time(), unit_id),
+            )
+            for kind, items in follow_ups:
+                self._insert_units(db, row['crawl'], kind, items)
+            return True
+
+    def release(self, unit_id, worker_id, error=None):
+        """Gives a unit back: pending again after attempts * retry_delay, or failed once it ran out of attempts"""
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                '''UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                   owner = NULL, lease_expires = NULL, not_before = ? + attempts * ?, error = ?, updated_at = ?
+                   WHERE unit_id = ? AND owner = ? AND status = 'leased' ''',
+                (self.max_attempts, now, self.retry_delay, error, now, unit_id, worker_id),
+            )
+
+    def counts(self, crawl):
+        """{kind: {status: count}}; expired leases are counted as pending"""
+        now = time.time()
+        with self._connect() as db:
+            rows = db.execute(
+                '''SELECT kind, CASE WHEN status = 'leased' AND lease_expires < ? THEN 'pending' ELSE status END
+                   AS state, COUNT(*) AS n FROM units WHERE crawl = ? GROUP BY kind, state''',
+                (now, crawl),
+            ).fetchall()
+        counts = {}
+        for row in rows:
+            counts.setdefault(row['kind'], {})[row['state']] = row['n']
+        return counts
+
+    def is_finished(self, crawl):
+        counts = self.counts(crawl)
+        return bool(counts) and not any(
+            states.get('pending') or states.get('leased') for states in counts.values())
+
+    def results(self, crawl, kind='advert'):
+        """Yields (item, result) of the done units of a kind"""
+        with self._connect() as db:
+            for row in db.execute("SELECT item, result FROM units WHERE crawl = ? AND kind = ? AND status = 'done' "
+                                  'ORDER BY item', (crawl, kind)):
+                yield row['item'], json.loads(row['result'])
+
+    def wait_for_slot(self, host, rate=RATE_PER_HOST):
+        """Blocks until this worker may send a request to `host` without the crawl exceeding `rate` per second.
+
+        Slots are handed out from a shared per-host clock, so the limit holds across processes.
+        """
+        if rate <= 0:
+            return
+        with self._transaction() as db:
+            row = db.execute('SELECT next_at FROM host_slots WHERE host = ?', (host,)).fetchone()
+            slot = max(time.time(), row['next_at'] if row else 0)
+            db.execute('INSERT OR REPLACE INTO host_slots (host, next_at) VALUES (?, ?)', (host, slot + 1 / rate))
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RateLimitedSession(Session):
+    """requests Session that takes a slot of the crawl-wide per-host rate limit before every request"""
+
+    def __init__(self, coordinator, rate=RATE_PER_HOST):
+        super().__init__()
+        self.coordinator = coordinator
+        self.rate = rate
+
+    def request(self, method, url, *args, **kwargs):
+        self.coordinator.wait_for_slot(urlsplit(url).hostname or '', self.rate)
+        return super().request(method, url, *args, **kwargs)
+
+
+def seed(coordinator, adapter, crawl, max_pages=None):
+    """Adds a listing unit per page of the source; safe to repeat"""
+    pages = adapter.count_listing_pages()
+    if max_pages is not None:
+        pages = min(pages, max_pages)
+    coordinator.add_units(crawl, 'listing', range(1, pages + 1))
+    return pages
+
+
+@contextmanager
+def heartbeating(coordinator, worker_id, interval=None):
+    """Keeps the worker's leases alive from a background thread while the block runs"""
+    interval = interval or coordinator.lease_seconds / 3
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                coordinator.heartbeat(worker_id)
+            except sqlite3.Error as e:
+                logger.warning(f'Heartbeat of {worker_id} failed: {e}')
+
+    thread = threading.Thread(target=run, name='crawl-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def process_unit(adapter, unit):
+    """Runs one unit, returns (result, follow-up units)"""
+    if unit['kind'] == 'listing':
+        advert_ids = adapter.list_tender_ids_page(int(unit['item']))
+        return {'advert_ids': advert_ids}, [('advert', advert_ids)]
+    return asdict(adapter.fetch_tender(unit['item'])), []
+
+
+def run_worker(coordinator, adapter, crawl, worker_id=None, idle_wait=1.0, stop=None):
+    """Claims and processes units of the crawl until none are left; returns the number of units done.
+
+    Waits while other workers still hold units, their listing pages may add adverts or their leases may expire.
+    """
+    worker_id = worker_id or new_worker_id()
+    done = 0
+    with heartbeating(coordinator, worker_id):
+        while stop is None or not stop.is_set():
+            units = coordinator.claim(crawl, worker_id)
+            if not units:
+                if coordinator.is_finished(crawl):
+                    break
+                time.sleep(idle_wait)
+                continue
+
+            for unit in units:
+                try:
+                    result, follow_ups = process_unit(adapter, unit)
+                except Exception as e:
+                    logger.error(f'{worker_id}: {unit["unit_id"]} failed (attempt {unit["attempts"]}): {e}')
+                    coordinator.release(unit['unit_id'], worker_id, error=str(e))
+                    continue
+                if coordinator.complete(unit['unit_id'], worker_id, result, follow_ups):
+                    done += 1
+    logger.info(f'{worker_id}: {done} units done')
+    return done
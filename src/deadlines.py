@@ -0,0 +1,76 @@
+import math
+import os
+import threading
+import time
+
+# Time budget of one report and caps of its stages, seconds
+REPORT_DEADLINE = float(os.environ.get('REPORT_DEADLINE', 900))
+STAGE_DEADLINES = {
+    'fetch': float(os.environ.get('DEADLINE_FETCH', 180)),
+    'download': float(os.environ.get('DEADLINE_DOWNLOAD', 180)),
+    'upload': float(os.environ.get('DEADLINE_UPLOAD', 120)),
+    'analysis': float(os.environ.get('DEADLINE_ANALYSIS', 600)),
+}
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class Deadline:
+    """Overall deadline of a report task, per-stage timeouts within it and a cancel flag.
+
+    The async pipeline turns `start_stage` into asyncio.timeout and is cancelled through its task;
+    the threads pipeline calls `check` between blocking calls.
+    """
+
+    def __init__(self, total=REPORT_DEADLINE, stages=STAGE_DEADLINES):
+        self.expires_at = time.monotonic() + total
+        self.stages = stages
+        self.stage = None
+        self.stage_expires_at = None
+        self.cancelled = threading.Event()
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def start_stage(self, stage):
+        """Enters a stage and returns its timeout: the stage cap, cut by what is left of the overall deadline"""
+        if self.cancelled.is_set():
+            raise TaskCancelled()
+        if self.remaining() == 0:
+            raise TimeoutError('Report deadline exceeded')
+        self.stage = stage
+        timeout = min(self.stages.get(stage, math.inf), self.remaining())
+        self.stage_expires_at = time.monotonic() + timeout
+        return timeout
+
+    def stage_remaining(self):
+        return max(self.stage_expires_at - time.monotonic(), 0.0) if self.stage_expires_at else self.remaining()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise TaskCancelled()
+        if self.stage_expires_at is not None and time.monotonic() >= self.stage_expires_at:
+            raise TimeoutError(f'Stage {self.stage} exceeded its deadline')
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+def section_statuses(result, reason=None):
+    """Status of each report section: ok, error, or why it is missing (timeout / cancelled / error)"""
+    missing = reason or 'error'
+    statuses = {
+        'advert': 'ok' if 'organizer_name' in result else missing,
+        'lots_info': 'ok' if 'lots_info' in result else missing,
+        'techspec_files': 'ok' if 'techspec_files' in result else missing,
+    }
+    for key in ('techspec_analyzed', 'affiliate_analysis'):
+        if key not in result:
+            statuses[key] = missing
+        elif isinstance(result[key], str) and result[key].startswith('Error:'):
+            statuses[key] = 'error'
+        else:
+            statuses[key] = 'ok'
+    return statuses
@@ -1,13 +1,35 @@
 import time
+import asyncio
+import httpx
 import requests
 from bs4 import BeautifulSoup
 import os
 import re
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from src.models import Tender, Lot, TechspecFile, parse_amount
+from src.sources import SourceAdapter
+from src.metrics import span, traced, set_attrs, observe_http, run_traced, adopt_spans, RETRIES, TRANSFER_BYTES
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# overridable to run against a local mock (see benchmarks/mock_server.py)
+GOSZAKUP_URL = os.environ.get('GOSZAKUP_URL', 'https://goszakup.gov.kz')
+ECC_URL = os.environ.get('ECC_URL', 'https://help.ecc.kz')
+# pause before each tab request, to stay polite with the portal
+REQUEST_DELAY = float(os.environ.get('GOSZAKUP_REQUEST_DELAY', 1))
+# per-request timeout of portal calls, so a hung connection can't hold a report forever
+HTTP_TIMEOUT = float(os.environ.get('GOSZAKUP_HTTP_TIMEOUT', 60))
+# worker processes for BeautifulSoup parsing, keeps CPU-bound work off the server's GIL; 0 parses inline
+PARSE_PROCESSES = int(os.environ.get('GOSZAKUP_PARSE_PROCESSES', 0))
+
+_parse_executor = None
+_parse_executor_lock = threading.Lock()
+_ssl_context = None
+
 headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36',
     'Origin': 'https://goszakup.gov.kz',
@@ -16,14 +38,33 @@ headers = {
 }
 
 
+@traced()
 def get_access_token(headers):
     auth_data = {"client_id": "widget-aiis-epp"}
-    auth_url = 'https://help.ecc.kz/bridge/auth'
-    auth_response = requests.post(auth_url, headers=headers, json=auth_data)
+    auth_url = f'{ECC_URL}/bridge/auth'
+    auth_response = requests.post(auth_url, headers=headers, json=auth_data, timeout=HTTP_TIMEOUT)
+    auth_token = auth_response.json()['creds']['auth_token']
+
+    session_token_url = f"{ECC_URL}/bridge/session?auth_token={auth_token}"
+    response = requests.post(session_token_url, headers=headers, timeout=HTTP_TIMEOUT)
+    return response.json()['data']['access_token']
+
+
+def make_async_client():
+    """httpx counterpart of a requests Session with `headers`: follows redirects, no short default timeout"""
+    global _ssl_context
+    if _ssl_context is None:
+        # loading the CA bundle costs ~30ms of CPU, too much to repeat for every advert
+        _ssl_context = httpx.create_ssl_context()
+    return httpx.AsyncClient(headers=headers, follow_redirects=True, timeout=httpx.Timeout(HTTP_TIMEOUT), verify=_ssl_context)
+
+
+@traced()
+async def aget_access_token(client, headers):
+    auth_response = await client.post(f'{ECC_URL}/bridge/auth', headers=headers, json={"client_id": "widget-aiis-epp"})
     auth_token = auth_response.json()['creds']['auth_token']
 
-    session_token_url = f"https://help.ecc.kz/bridge/session?auth_token={auth_token}"
-    response = requests.post(session_token_url, headers=headers)
+    response = await client.post(f"{ECC_URL}/bridge/session?auth_token={auth_token}", headers=headers)
     return response.json()['data']['access_token']
 
 
@@ -31,14 +72,38 @@ def send_request(session, url: str, method: str = 'get', retries: int = 3, *args
     action = getattr(session, method, None)
     if action is None:
         raise ValueError(f"Unknown HTTP method: {method}")
-
-    for attempt in range(retries + 1):
-        try:
-            return action(url, *args, **kwargs)
-        except (requests.ConnectionError, requests.Timeout) as err:
-            if attempt == retries:
-                raise
-            time.sleep(0.1)
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+
+    with span('send_request', method=method, url=url):
+        for attempt in range(retries + 1):
+            try:
+                started_at = time.perf_counter()
+                response = action(url, *args, **kwargs)
+                size = observe_http(url, response, time.perf_counter() - started_at)
+                set_attrs(status=response.status_code, bytes=size, retries=attempt)
+                return response
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if attempt == retries:
+                    raise
+                RETRIES.labels('goszakup').inc()
+                time.sleep(0.1)
+
+
+async def asend_request(client, url: str, method: str = 'get', retries: int = 3, **kwargs):
+    """send_request for an httpx.AsyncClient"""
+    with span('send_request', method=method, url=url):
+        for attempt in range(retries + 1):
+            try:
+                started_at = time.perf_counter()
+                response = await client.request(method.upper(), url, **kwargs)
+                size = observe_http(url, response, time.perf_counter() - started_at)
+                set_attrs(status=response.status_code, bytes=size, retries=attempt)
+                return response
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+                RETRIES.labels('goszakup').inc()
+                await asyncio.sleep(0.1)
 
 
 def extract_data_from_advert(lot_html):
@@ -56,43 +121,44 @@ def safe_int_convert(string):
         return None
 
 def get_max_adverts_count(session, base_url):    
-    response = send_request(base_url.format(page_num=1))
+    response = send_request(session, base_url.format(page_num=1))
     soup = BeautifulSoup(response.content, 'html.parser')
     all_adverts_on_page = soup.find('table', {'id': 'search-result'}).find('tbody').find_all('tr')
     max_adverts = [safe_int_convert(i) for i in soup.find('div', {'class': 'dataTables_info'}).text.split(' ') if safe_int_convert(i) is not None][-1]
     return max_adverts
 
-def get_lots_basic_info(session, base_url):
-    max_adverts = get_max_adverts_count(base_url)
+# adverts per listing page, matches count_record in GoszakupAdapter.search_url
+LISTING_PAGE_SIZE = 500
+
+
+def get_listing_pages_count(session, base_url):
+    return get_max_adverts_count(session, base_url) // LISTING_PAGE_SIZE + 1
+
+
+def get_listing_page(session, base_url, page_num):
+    """Adverts ({'id', 'url'}) of one search results page, `page_num` starts from 1"""
+    response = send_request(session, base_url.format(page_num=page_num), method='get')
+    response.raise_for_status()
+    soup = BeautifulSoup(response.content, 'html.parser')
+    return [extract_data_from_advert(lot_html)
+            for lot_html in soup.find('table', {'id': 'search-result'}).find('tbody').find_all('tr')]
 
-    cur_page = 1
 
-    offset = 500
-    max_pages = max_adverts // offset + 1
+def get_lots_basic_info(session, base_url, page_limit=None):
+    max_pages = get_listing_pages_count(session, base_url)
+    if page_limit is not None:
+        max_pages = min(max_pages, page_limit)
     
     result = []
 
-    while cur_page <= max_pages:
-
+    for cur_page in range(1, max_pages + 1):
         print(f'parsing {cur_page} out of {max_pages}')
-        
-        # response = session.get(url.format(page_num=cur_page), headers=headers)
-        response = send_request(session, base_url.format(page_num=cur_page), method='get')
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        if soup:
-            all_lots_on_page = soup.find('table', {'id': 'search-result'}).find('tbody').find_all('tr')
-        
-        for lot_html in all_lots_on_page:
-            result.append(extract_data_from_advert(lot_html))
-        
-        cur_page += 1
+        result.extend(get_listing_page(session, base_url, cur_page))
         time.sleep(2)
 
-    session.close()
     return result
 
+@traced()
 def parse_advert_view_info(advert_view_info):
         # 2. Словарь для перевода русских названий полей на английский
         # Используем короткие и понятные названия
@@ -122,6 +188,7 @@ def parse_advert_view_info(advert_view_info):
 
     return parsed_data
 
+@traced()
 def parse_obshie_svedeniya(general_info):
     # 2. Словарь для перевода русских названий полей
     translation_map = {
@@ -165,6 +232,7 @@ def parse_obshie_svedeniya(general_info):
     
     return parsed_data
 
+@traced()
 def parse_organizator_info(organizator_info):
     translation_map = {
         'ФИО представителя': 'representative_name',
@@ -191,6 +259,7 @@ def parse_organizator_info(organizator_info):
     # 5. Вывод результата
     return parsed_data
 
+@traced()
 def parse_lots(soup):
     # 2. Словарь для перевода русских названий полей
     translation_map = {
@@ -250,8 +319,8 @@ def parse_lots(soup):
 
     return parsed_lots
 
-def parse_techspec_id(session, docs_soup):
-
+def find_techspec_params(docs_soup):
+    """Arguments of actionModalShowFiles of the technical specification row on the documents tab"""
     REGEX = r'actionModalShowFiles\((.*)\)'
     all_docs = docs_soup.find_all('table')[-1].find_all('tr')
     for doc in all_docs:
@@ -270,21 +339,15 @@ def parse_techspec_id(session, docs_soup):
 
             onclick_value = button.get('onclick', '')
             match = re.search(REGEX, onclick_value)
-            action_params = None
             if match:
                 # Извлекаем содержимое скобок (группа 1)
-                techspec_id = match.group(1)
-                break
-    
-    params = techspec_id.split(',')
+                return match.group(1).split(',')
 
-    response = send_request(
-        session, 
-        f'https://goszakup.gov.kz/ru/announce/actionAjaxModalShowFiles/{params[0]}/{params[1]}'
-    )
+    raise ValueError('Technical specification not found on the documents tab')
 
-    response.raise_for_status()
-    files_soup = BeautifulSoup(response.content, 'html.parser')
+
+def parse_techspec_rows(content, lot_id):
+    files_soup = BeautifulSoup(content, 'html.parser')
     all_rows_in_files_specs = files_soup.find_all('tr')
     file_links = []
     for row_file_spec in all_rows_in_files_specs:
@@ -293,7 +356,7 @@ def parse_techspec_id(session, docs_soup):
             continue
         file_links.append(
             {
-                'lot_id': params[0],
+                'lot_id': lot_id,
                 'file_link': cols[1].find('a')['href'],
                 'file_name': cols[1].find('a').get_text(strip=True)
             }
@@ -302,6 +365,30 @@ def parse_techspec_id(session, docs_soup):
     return file_links 
 
 
+def fetch_techspec_files(session, params):
+    response = send_request(
+        session, 
+        f'{GOSZAKUP_URL}/ru/announce/actionAjaxModalShowFiles/{params[0]}/{params[1]}'
+    )
+    response.raise_for_status()
+    return run_parser(parse_techspec_rows, response.content, params[0])
+
+
+async def afetch_techspec_files(client, params):
+    response = await asend_request(
+        client,
+        f'{GOSZAKUP_URL}/ru/announce/actionAjaxModalShowFiles/{params[0]}/{params[1]}'
+    )
+    response.raise_for_status()
+    return await arun_parser(parse_techspec_rows, response.content, params[0])
+
+
+@traced()
+def parse_techspec_id(session, docs_soup):
+    return fetch_techspec_files(session, find_techspec_params(docs_soup))
+
+
+@traced()
 def download_techspec_files(session, files_info, save_dir='techspec_files_download'):
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
@@ -316,23 +403,33 @@ def download_techspec_files(session, files_info, save_dir='techspec_files_downlo
         response.raise_for_status()
         with open(filepath, 'wb') as f:
             f.write(response.content)
+        TRANSFER_BYTES.labels('techspec_files', 'written').inc(len(response.content))
 
         logger.info(f'Saved to {filepath}')
 
 
-def get_full_zakup_info(session, zakup_id):
-    base_url = f'https://goszakup.gov.kz/ru/announce/index/{zakup_id}' # 15746632
-    general_url = base_url + '?tab=general'
-    lots_url = base_url + '?tab=lots'
-    docs_url = base_url + '?tab=documents'
-    winners_url = base_url + '?tab=winners'
+@traced('download_techspec_files')
+async def adownload_techspec_files(client, files_info, save_dir='techspec_files_download'):
+    """download_techspec_files for an httpx.AsyncClient, the files are fetched concurrently"""
+    os.makedirs(save_dir, exist_ok=True)
 
-    # ----------------------------- #
-    # print('parsing main info')
-    time.sleep(1)
-    response = send_request(session, general_url, method='get')
-    response.raise_for_status()
-    soup = BeautifulSoup(response.content, 'html.parser')
+    async def download(item):
+        filepath = os.path.join(save_dir, item['file_name'])
+        response = await asend_request(client, item['file_link'])
+        response.raise_for_status()
+        with open(filepath, 'wb') as f:
+            f.write(response.content)
+        TRANSFER_BYTES.labels('techspec_files', 'written').inc(len(response.content))
+        logger.info(f'Saved to {filepath}')
+
+    await asyncio.gather(*(download(item) for item in files_info))
+
+
+# Page-level parsers take raw page bytes and return plain dicts, so they can run in worker processes
+
+
+def parse_general_page(content):
+    soup = BeautifulSoup(content, 'html.parser')
 
     applications_count = soup.find('label', class_='label label-info')
     if applications_count is None:
@@ -347,33 +444,170 @@ def get_full_zakup_info(session, zakup_id):
     advert_view_info = parse_advert_view_info(advert_view_info_soup)
     organizator_info = parse_organizator_info(general_info.find_all('table')[1])
     obshie_svedeniya = parse_obshie_svedeniya(general_info.find_all('table')[0])
+    return {
+        **advert_view_info,
+        'applications_count': applications_count,
+        **obshie_svedeniya,
+        **organizator_info,
+    }
+
+
+def parse_lots_page(content):
+    soup = BeautifulSoup(content, 'html.parser').find('div', class_='table-responsive')
+    return parse_lots(soup)
+
+
+def parse_documents_page(content):
+    return find_techspec_params(BeautifulSoup(content, 'html.parser'))
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def get_parse_executor():
+    """Warm process pool for the page parsers, None when PARSE_PROCESSES is 0 (parse inline)"""
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is None and PARSE_PROCESSES > 0:
+            # spawn: forking a process that already runs server threads and the OpenAI loop is unsafe
+            _parse_executor = ProcessPoolExecutor(PARSE_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+            # start every worker now, so the first adverts don't pay for interpreter start and imports
+            for future in [_parse_executor.submit(_warm_up) for _ in range(PARSE_PROCESSES)]:
+                future.result()
+        return _parse_executor
+
+
+def run_parser(func, *args):
+    """Runs a page parser in the process pool if it is enabled, in the calling thread otherwise"""
+    executor = get_parse_executor()
+    with span(func.__name__, processes=PARSE_PROCESSES):
+        if executor is None:
+            return func(*args)
+        # the nested parse_* spans come back from the worker process with the result
+        result, trace = executor.submit(run_traced, func, *args).result()
+        adopt_spans(trace)
+        return result
+
+
+async def arun_parser(func, *args):
+    """run_parser for coroutines: the event loop keeps serving while the page is parsed"""
+    executor = get_parse_executor()
+    with span(func.__name__, processes=PARSE_PROCESSES):
+        if executor is None:
+            return await asyncio.to_thread(func, *args)
+        result, trace = await asyncio.wrap_future(executor.submit(run_traced, func, *args))
+        adopt_spans(trace)
+        return result
+
+
+@traced()
+def get_full_zakup_info(session, zakup_id, result=None):
+    """Advert info, lots and techspec files. Sections are added to `result` as they are parsed,
+    so a caller interrupted by a deadline keeps what was already collected"""
+    result = {} if result is None else result
+    base_url = f'{GOSZAKUP_URL}/ru/announce/index/{zakup_id}' # 15746632
+    general_url = base_url + '?tab=general'
+    lots_url = base_url + '?tab=lots'
+    docs_url = base_url + '?tab=documents'
+    winners_url = base_url + '?tab=winners'
+
+    # ----------------------------- #
+    # print('parsing main info')
+    time.sleep(REQUEST_DELAY)
+    response = send_request(session, general_url, method='get')
+    response.raise_for_status()
+    result.update(run_parser(parse_general_page, response.content))
+    result['organizer_bin'] = result['organizer_name'].split(' ')[0]
     
     # ----------------------------- #
     # print('parsing lots info')
-    time.sleep(1)
+    time.sleep(REQUEST_DELAY)
     response = send_request(session, lots_url, method='get')
     response.raise_for_status()
-    soup = BeautifulSoup(response.content, 'html.parser').find('div', class_='table-responsive')
-    lots_info = parse_lots(soup)
+    result['lots_info'] = run_parser(parse_lots_page, response.content)
 
     # ----------------------------- #
     # print('parsing techspecs')
-    time.sleep(1)
+    time.sleep(REQUEST_DELAY)
     response = send_request(session, docs_url, method='get')
     response.raise_for_status()
-    soup = BeautifulSoup(response.content, 'html.parser')
-    techspec_files = parse_techspec_id(session, soup)
+    techspec_params = run_parser(parse_documents_page, response.content)
+    result['techspec_files'] = fetch_techspec_files(session, techspec_params)
+    return result
 
-    # ----------------------------- #
-    nav_tabs = [i.get_text(strip=True).lower() for i in soup.find('ul', class_='nav nav-tabs').find_all('li')]
 
-    result = {
-        **advert_view_info,
-        'applications_count': applications_count,
-        **obshie_svedeniya,
-        **organizator_info,
-        'lots_info': lots_info,
-        'techspec_files': techspec_files,
-    }
+@traced('get_full_zakup_info')
+async def aget_full_zakup_info(client, zakup_id, result=None):
+    """get_full_zakup_info for an httpx.AsyncClient, same result"""
+    result = {} if result is None else result
+    base_url = f'{GOSZAKUP_URL}/ru/announce/index/{zakup_id}'
+
+    async def get_tab(tab):
+        await asyncio.sleep(REQUEST_DELAY)
+        response = await asend_request(client, f'{base_url}?tab={tab}')
+        response.raise_for_status()
+        return response.content
+
+    result.update(await arun_parser(parse_general_page, await get_tab('general')))
     result['organizer_bin'] = result['organizer_name'].split(' ')[0]
+    result['lots_info'] = await arun_parser(parse_lots_page, await get_tab('lots'))
+    techspec_params = await arun_parser(parse_documents_page, await get_tab('documents'))
+    result['techspec_files'] = await afetch_techspec_files(client, techspec_params)
     return result
+
+
+def tender_from_goszakup(result):
+    return Tender(
+        source='goszakup',
+        tender_id=str(result.get('tender_id')),
+        name=result.get('tender_name'),
+        status=result.get('tender_status'),
+        organizer_name=result.get('organizer_name'),
+        organizer_bin=result.get('organizer_bin'),
+        procurement_method=result.get('procurement_method'),
+        publication_date=result.get('publication_date'),
+        application_start_date=result.get('application_start_date'),
+        application_end_date=result.get('application_end_date'),
+        amount=parse_amount(result.get('procurement_amount')),
+        applications_count=result.get('applications_count'),
+        lots=[
+            Lot(
+                lot_id=lot.get('lot_id'),
+                lot_number=lot.get('lot_number'),
+                name=lot.get('item_name'),
+                description=lot.get('additional_specs'),
+                customer=lot.get('customer'),
+                unit_price=parse_amount(lot.get('unit_price')),
+                quantity=parse_amount(lot.get('quantity')),
+                unit_of_measure=lot.get('unit_of_measure'),
+                amount=parse_amount(lot.get('planned_amount')),
+                status=lot.get('lot_status'),
+            )
+            for lot in result.get('lots_info', [])
+        ],
+        techspec_files=[
+            TechspecFile(file_name=f['file_name'], file_link=f.get('file_link'), lot_id=f.get('lot_id'))
+            for f in result.get('techspec_files', [])
+        ],
+    )
+
+
+class GoszakupAdapter(SourceAdapter):
+    source = 'goszakup'
+    search_url = GOSZAKUP_URL + '/ru/search/announce?count_record=500&page={page_num}'
+
+    def __init__(self, session):
+        self.session = session
+
+    def list_tender_ids(self, max_pages=None):
+        return [str(advert['id']) for advert in get_lots_basic_info(self.session, self.search_url, max_pages)]
+
+    def count_listing_pages(self):
+        return get_listing_pages_count(self.session, self.search_url)
+
+    def list_tender_ids_page(self, page):
+        return [str(advert['id']) for advert in get_listing_page(self.session, self.search_url, page)]
+
+    def fetch_tender(self, tender_id):
+        return tender_from_goszakup(get_full_zakup_info(self.session, tender_id))
@@ -0,0 +1,176 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# LLM requests take minutes, the default buckets stop at 10s
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram('tender_stage_duration_seconds', 'Duration of pipeline stages', ['stage'], buckets=BUCKETS)
+STAGE_ERRORS = Counter('tender_stage_errors_total', 'Pipeline stages that raised', ['stage'])
+HTTP_SECONDS = Histogram('tender_http_request_duration_seconds', 'Portal HTTP request latency', ['host'], buckets=BUCKETS)
+HTTP_RESPONSES = Counter('tender_http_responses_total', 'Portal HTTP responses', ['host', 'status'])
+TRANSFER_BYTES = Counter('tender_transfer_bytes_total', 'Bytes transferred', ['target', 'direction'])
+RETRIES = Counter('tender_retries_total', 'Retried requests', ['target'])
+LLM_TOKENS = Counter('tender_llm_tokens_total', 'Tokens used by LLM requests', ['model', 'kind'])
+
+# (span, trace started_at) of the innermost open span; run_coroutine_threadsafe copies the context,
+# so spans opened on the OpenAI loop nest under the span that submitted the request
+_current = contextvars.ContextVar('current_span', default=None)
+_tree_lock = threading.Lock()
+
+
+def _new_span(name, started_at, trace_started_at, attrs):
+    return {
+        'name': name,
+        'start_ms': round((started_at - trace_started_at) * 1000, 1),
+        'duration_ms': None,
+        'attrs': attrs,
+        'children': [],
+    }
+
+
+@contextmanager
+def start_trace(name, **attrs):
+    """Opens the root span of a task; spans opened inside (in this thread or on the OpenAI loop) nest under it"""
+    started_at = time.perf_counter()
+    root = _new_span(name, started_at, started_at, attrs)
+    token = _current.set((root, started_at))
+    try:
+        with span(name, _record=False):
+            yield root
+    except BaseException as e:
+        with _tree_lock:
+            root['error'] = repr(e)
+        raise
+    finally:
+        root['duration_ms'] = round((time.perf_counter() - started_at) * 1000, 1)
+        _current.reset(token)
+
+
+@contextmanager
+def span(stage, _record=True, **attrs):
+    """Times a stage into STAGE_SECONDS and, inside a trace, records it as a child of the current span"""
+    current = _current.get()
+    started_at = time.perf_counter()
+    record = token = None
+    if current is not None and _record:
+        parent, trace_started_at = current
+        record = _new_span(stage, started_at, trace_started_at, attrs)
+        with _tree_lock:
+            parent['children'].append(record)
+        token = _current.set((record, trace_started_at))
+    try:
+        yield record
+    except BaseException as e:
+        STAGE_ERRORS.labels(stage).inc()
+        if record is not None:
+            with _tree_lock:
+                record['error'] = repr(e)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started_at
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        if token is not None:
+            record['duration_ms'] = round(elapsed * 1000, 1)
+            _current.reset(token)
+
+
+def set_attrs(**attrs):
+    """Adds attributes to the current span, e.g. sizes known only at the end of a stage"""
+    current = _current.get()
+    if current is not None:
+        with _tree_lock:
+            current[0]['attrs'].update(attrs)
+
+
+def traced(stage=None):
+    """Decorator form of `span`, the stage defaults to the function name"""
+    def decorator(func):
+        name = stage or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run_traced(func, *args):
+    """Runs func in a trace of its own, returns (result, trace).
+
+    For process pools: spans and metrics recorded in a worker process stay there, the parent
+    passes the returned trace to `adopt_spans`.
+    """
+    with start_trace(func.__name__) as root:
+        result = func(*args)
+    return result, root
+
+
+def adopt_spans(trace):
+    """Records the spans of a trace made in another process into STAGE_SECONDS and, inside a trace,
+    under the current span, placed as if that work ended just now"""
+    current = _current.get()
+    shift = None
+    if current is not None:
+        parent, trace_started_at = current
+        shift = (time.perf_counter() - trace_started_at) * 1000 - trace['duration_ms']
+
+    def adopt(record):
+        STAGE_SECONDS.labels(record['name']).observe(record['duration_ms'] / 1000)
+        if 'error' in record:
+            STAGE_ERRORS.labels(record['name']).inc()
+        if shift is not None:
+            record['start_ms'] = round(record['start_ms'] + shift, 1)
+        for child in record['children']:
+            adopt(child)
+
+    for child in trace['children']:
+        adopt(child)
+    if current is not None:
+        with _tree_lock:
+            parent['children'].extend(trace['children'])
+
+
+def _copy_span(record):
+    return {**record, 'attrs': dict(record['attrs']), 'children': [_copy_span(c) for c in record['children']]}
+
+
+def snapshot(trace):
+    """Copy of a trace that is safe to serialize while the task keeps adding spans"""
+    with _tree_lock:
+        return _copy_span(trace)
+
+
+def observe_http(url, response, elapsed):
+    host = urlsplit(url).hostname or ''
+    HTTP_SECONDS.labels(host).observe(elapsed)
+    HTTP_RESPONSES.labels(host, str(response.status_code)).inc()
+    size = len(response.content)
+    TRANSFER_BYTES.labels(host, 'received').inc(size)
+    return size
+
+
+def record_llm_usage(model, usage):
+    if usage is None:
+        return
+    LLM_TOKENS.labels(model, 'input').inc(usage.input_tokens or 0)
+    LLM_TOKENS.labels(model, 'output').inc(usage.output_tokens or 0)
+    set_attrs(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+
+
+def export():
+    """Body and content type of the Prometheus /metrics response"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,63 @@
+import re
+from dataclasses import dataclass, field
+
+# Compact source-agnostic records. slots=True drops the per-instance __dict__,
+# which matters when millions of lots are kept in memory.
+
+
+@dataclass(slots=True)
+class TechspecFile:
+    file_name: str
+    file_link: str | None = None
+    lot_id: str | None = None
+
+
+@dataclass(slots=True)
+class Lot:
+    lot_id: str | None = None
+    lot_number: str | None = None
+    name: str | None = None
+    description: str | None = None
+    customer: str | None = None
+    unit_price: float | None = None
+    quantity: float | None = None
+    unit_of_measure: str | None = None
+    amount: float | None = None
+    status: str | None = None
+    delivery_place: str | None = None
+    delivery_term: str | None = None
+
+
+@dataclass(slots=True)
+class Tender:
+    source: str
+    tender_id: str
+    name: str | None = None
+    status: str | None = None
+    organizer_name: str | None = None
+    organizer_bin: str | None = None
+    procurement_method: str | None = None
+    publication_date: str | None = None
+    application_start_date: str | None = None
+    application_end_date: str | None = None
+    amount: float | None = None
+    applications_count: int | None = None
+    lots: list[Lot] = field(default_factory=list)
+    techspec_files: list[TechspecFile] = field(default_factory=list)
+
+
+def parse_amount(value):
+    """'1 234 567,89 ₸' -> 1234567.89; None if there is no number"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = re.sub(r'[^\d,.\-]', '', str(value)).replace(',', '.')
+    # thousands separators written as dots: keep only the last one as decimal point
+    if text.count('.') > 1:
+        head, _, tail = text.rpartition('.')
+        text = head.replace('.', '') + '.' + tail
+    try:
+        return float(text)
+    except ValueError:
+        return None
@@ -0,0 +1,254 @@
+import json
+import os
+import time
+import logging
+from datetime import datetime
+from src.openai_client import build_response_body, extract_output_text
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/responses"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# USD per 1M tokens (input, output) on the standard tier; batch jobs are billed at half price
+MODEL_PRICES = {
+    "gpt-5-nano": (0.05, 0.40),
+    "gpt-5-mini": (0.25, 2.00),
+    "gpt-5": (1.25, 10.00),
+}
+BATCH_DISCOUNT = 0.5
+
+# techspec files have to outlive the batch completion window (24h)
+BATCH_FILE_TTL = 2 * 24 * 3600
+
+
+def make_custom_id(advert_id, key):
+    return f"{advert_id}:{key}"
+
+
+def split_custom_id(custom_id):
+    advert_id, key = custom_id.split(":", 1)
+    return advert_id, key
+
+
+def load_state(state_path):
+    if not os.path.exists(state_path):
+        return {"adverts": {}, "batches": []}
+    with open(state_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, state_path):
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, state_path)
+
+
+def build_batch_lines(pending, prompts, model="gpt-5-nano"):
+    """pending: {custom_id: [file_ids]}, prompts: {analysis key: prompt text}"""
+    lines = []
+    for custom_id, file_ids in pending.items():
+        _, key = split_custom_id(custom_id)
+        lines.append(json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": build_response_body(prompts[key], file_ids, model, enable_web_search=False),
+        }, ensure_ascii=False))
+    return lines
+
+
+def submit_batch(client, lines, jsonl_path):
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    with open(jsonl_path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+    )
+    logger.info(f"Submitted batch {batch.id} with {len(lines)} requests")
+    return batch
+
+
+def wait_for_batch(client, batch_id, poll_interval=30, timeout=None):
+    started_at = time.time()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts is not None:
+            logger.info(f"Batch {batch_id}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if timeout is not None and time.time() - started_at > timeout:
+            raise TimeoutError(f"Batch {batch_id} is still {batch.status} after {timeout}s")
+        time.sleep(poll_interval)
+
+
+def _read_jsonl_file(client, file_id):
+    if not file_id:
+        return []
+    content = client.files.content(file_id).text
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def collect_batch_results(client, batch):
+    """Returns ({custom_id: response body}, {custom_id: error message})"""
+    results = {}
+    errors = {}
+
+    for line in _read_jsonl_file(client, batch.output_file_id) + _read_jsonl_file(client, batch.error_file_id):
+        custom_id = line.get("custom_id")
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or (response.get("body") or {}).get("error") or response.get("status_code")
+            errors[custom_id] = str(error)
+        else:
+            results[custom_id] = response["body"]
+
+    return results, errors
+
+
+def write_results_to_reports(results, reports_dir="reports"):
+    by_advert = {}
+    for custom_id, body in results.items():
+        advert_id, key = split_custom_id(custom_id)
+        by_advert.setdefault(advert_id, {})[key] = extract_output_text(body)
+
+    for advert_id, analyses in by_advert.items():
+        report_path = os.path.join(reports_dir, f"goszakup_{advert_id}.json")
+        report = {}
+        if os.path.exists(report_path):
+            with open(report_path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        report.update(analyses)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+
+    return list(by_advert)
+
+
+def done_in_report(done, advert_id, reports_dir="reports"):
+    """Keys of `done` whose analyses are still in the report; the rest are sent again"""
+    report_path = os.path.join(reports_dir, f"goszakup_{advert_id}.json")
+    if not done or not os.path.exists(report_path):
+        return []
+    with open(report_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    return [key for key in done if key in report]
+
+
+def estimate_cost(input_tokens, output_tokens, model):
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000 * BATCH_DISCOUNT
+
+
+def summarize_run(results, errors, model, started_at, finished_at):
+    input_tokens = sum((body.get("usage") or {}).get("input_tokens", 0) for body in results.values())
+    output_tokens = sum((body.get("usage") or {}).get("output_tokens", 0) for body in results.values())
+    elapsed = max(finished_at - started_at, 1e-9)
+    adverts = {split_custom_id(custom_id)[0] for custom_id in results}
+
+    return {
+        "started_at": datetime.fromtimestamp(started_at).isoformat(timespec="seconds"),
+        "elapsed_seconds": round(elapsed, 1),
+        "model": model,
+        "requests_succeeded": len(results),
+        "requests_failed": len(errors),
+        "adverts_completed": len(adverts),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "estimated_cost_usd": round(estimate_cost(input_tokens, output_tokens, model), 6),
+        "requests_per_minute": round(len(results) / elapsed * 60, 2),
+        "adverts_per_hour": round(len(adverts) / elapsed * 3600, 2),
+    }
+
+
+def run_batch_analysis(client, advert_ids, prepare_advert, prompts, model="gpt-5-nano",
+                       state_dir="batches", reports_dir="reports", poll_interval=30, max_rounds=3):
+    """Scrapes, uploads and analyses adverts through the Batch API.
+
+    `prepare_advert(advert_id)` must write the base report and return the OpenAI file ids of
+    its techspecs; it runs again for an advert whose uploads expired and should keep the analyses
+    already in the report. Progress is kept in `<state_dir>/state.json`, so an interrupted run
+    picks up the in-flight batch and only resubmits requests that have not succeeded yet.
+    """
+    state_path = os.path.join(state_dir, "state.json")
+    state = load_state(state_path)
+    wanted = list(dict.fromkeys(map(str, advert_ids)))
+    started_at = time.time()
+    all_results = {}
+    errors = {}
+
+    for advert_id in wanted:
+        advert_state = state["adverts"].get(advert_id)
+        if advert_state and (set(prompts) <= set(advert_state["done"])
+                             or time.time() - advert_state["uploaded_at"] < BATCH_FILE_TTL):
+            continue
+        try:
+            file_ids = prepare_advert(advert_id)
+        except Exception as e:
+            logger.error(f"Failed to prepare advert {advert_id}: {e}", exc_info=True)
+            errors[make_custom_id(advert_id, "prepare")] = str(e)
+            continue
+        state["adverts"][advert_id] = {
+            "file_ids": file_ids,
+            "uploaded_at": time.time(),
+            "done": done_in_report((advert_state or {}).get("done", []), advert_id, reports_dir),
+        }
+        save_state(state, state_path)
+
+    for round_num in range(max_rounds):
+        in_flight = [b for b in state["batches"] if b["status"] not in TERMINAL_STATUSES | {"collected"}]
+
+        if not in_flight:
+            pending = {
+                make_custom_id(advert_id, key): advert_state["file_ids"]
+                for advert_id, advert_state in state["adverts"].items()
+                if advert_id in wanted
+                for key in prompts
+                if key not in advert_state["done"]
+            }
+            if not pending:
+                break
+            os.makedirs(state_dir, exist_ok=True)
+            jsonl_path = os.path.join(state_dir, f"input_{int(time.time())}.jsonl")
+            batch = submit_batch(client, build_batch_lines(pending, prompts, model), jsonl_path)
+            in_flight = [{"id": batch.id, "status": batch.status, "custom_ids": list(pending)}]
+            state["batches"].extend(in_flight)
+            save_state(state, state_path)
+
+        for batch_state in in_flight:
+            batch = wait_for_batch(client, batch_state["id"], poll_interval=poll_interval)
+            results, batch_errors = collect_batch_results(client, batch)
+
+            # requests that never made it into either output file (expired / cancelled batch)
+            for custom_id in batch_state["custom_ids"]:
+                if custom_id not in results and custom_id not in batch_errors:
+                    batch_errors[custom_id] = f"batch {batch.status}"
+
+            write_results_to_reports(results, reports_dir)
+            for custom_id in results:
+                advert_id, key = split_custom_id(custom_id)
+                if key not in state["adverts"][advert_id]["done"]:
+                    state["adverts"][advert_id]["done"].append(key)
+                errors.pop(custom_id, None)
+
+            all_results.update(results)
+            errors.update(batch_errors)
+            batch_state["status"] = "collected"
+            save_state(state, state_path)
+
+            logger.info(f"Batch {batch.id}: {len(results)} succeeded, {len(batch_errors)} failed (round {round_num + 1})")
+
+    summary = summarize_run(all_results, errors, model, started_at, time.time())
+    summary["errors"] = errors
+    os.makedirs(state_dir, exist_ok=True)
+    with open(os.path.join(state_dir, f"run_{int(started_at)}.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=4)
+    return summary
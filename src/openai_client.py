@@ -1,41 +1,260 @@
 import json
-from openai import OpenAI 
+import asyncio
+import atexit
+import collections
+import logging
+import random
+import threading
+import time
+import httpx
+from openai import OpenAI, AsyncOpenAI, RateLimitError, InternalServerError, APIConnectionError, APIStatusError
 import os
 from dotenv import load_dotenv
+from src.metrics import span, traced, set_attrs, record_llm_usage, RETRIES, TRANSFER_BYTES
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Budgets of the whole process, see https://platform.openai.com/settings/organization/limits
+RPM_LIMIT = int(os.environ.get("OPENAI_RPM_LIMIT", 500))
+TPM_LIMIT = int(os.environ.get("OPENAI_TPM_LIMIT", 200_000))
+MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", 5))
+# uploads bypass the scheduler, so transient 429/5xx/connection errors are left to the SDK (its default for sync calls)
+UPLOAD_RETRIES = int(os.environ.get("OPENAI_UPLOAD_RETRIES", 2))
+
+# Rough token estimates used to reserve TPM budget before the real usage is known
+FILE_TOKENS_ESTIMATE = 8_000
+OUTPUT_TOKENS_ESTIMATE = 4_000
+
+_lock = threading.Lock()
+_client = None
+_async_client = None
+_loop = None
+_scheduler = None
+
+
 def get_client():
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-    return client
+    global _client
+    with _lock:
+        if _client is None:
+            _client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        return _client
+
+
+def _get_loop():
+    """Event loop of the background thread that owns the async client and the scheduler"""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="openai-loop", daemon=True).start()
+        return _loop
+
+
+@atexit.register
+def _shutdown_loop():
+    if _loop is None:
+        return
+
+    async def cancel_dispatcher():
+        if _scheduler is not None and _scheduler._dispatcher is not None:
+            _scheduler._dispatcher.cancel()
+
+    try:
+        asyncio.run_coroutine_threadsafe(cancel_dispatcher(), _loop).result(timeout=1)
+    except Exception:
+        pass
+    _loop.call_soon_threadsafe(_loop.stop)
+
+
+def get_async_client():
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            # 429s are retried by the scheduler, so the SDK must not retry on its own
+            _async_client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+        return _async_client
+
+
+def get_scheduler():
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(RPM_LIMIT, TPM_LIMIT)
+        return _scheduler
+
+
+class RequestScheduler:
+    """Admits LLM requests within RPM/TPM budgets, round-robin across tasks.
+
+    All methods except `metrics` must be called from the loop returned by `_get_loop`.
+    """
+
+    def __init__(self, rpm, tpm, window=60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self._queues = collections.OrderedDict()  # task_key -> deque of (future, tokens, enqueued_at)
+        self._sent = collections.deque()  # [sent_at, tokens] of requests inside the window
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._dispatcher = None
+
+        self.dispatched = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def acquire(self, task_key, tokens):
+        """Waits for a turn and returns the budget entry to correct with `record_usage`"""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(task_key, collections.deque()).append((future, tokens, time.monotonic()))
+        self._wakeup.set()
+        return await future
+
+    def record_usage(self, entry, tokens):
+        entry[1] = tokens
+
+    def pause(self, delay):
+        self.rate_limited += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    def _seconds_until_fits(self, tokens):
+        now = time.monotonic()
+        while self._sent and now - self._sent[0][0] >= self.window:
+            self._sent.popleft()
+
+        wait = max(self._paused_until - now, 0.0)
+        if len(self._sent) >= self.rpm:
+            wait = max(wait, self._sent[0][0] + self.window - now)
+
+        used = sum(t for _, t in self._sent)
+        if self._sent and used + tokens > self.tpm:
+            # wait until enough old requests leave the window
+            for sent_at, sent_tokens in self._sent:
+                used -= sent_tokens
+                if used + tokens <= self.tpm:
+                    wait = max(wait, sent_at + self.window - now)
+                    break
+            else:
+                wait = max(wait, self._sent[-1][0] + self.window - now)
+        return wait
+
+    def _next_request(self):
+        task_key, queue = next(iter(self._queues.items()))
+        request = queue.popleft()
+        if queue:
+            self._queues.move_to_end(task_key)
+        else:
+            del self._queues[task_key]
+        return request
+
+    async def _dispatch(self):
+        while True:
+            if not self._queues:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            future, tokens, enqueued_at = self._next_request()
+            if future.done():  # caller was cancelled while queued
+                continue
+
+            wait = self._seconds_until_fits(tokens)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._seconds_until_fits(tokens)
+
+            if future.done():
+                continue
+            entry = [time.monotonic(), tokens]
+            self._sent.append(entry)
 
-def upload_files(client, file_path):
+            waited = entry[0] - enqueued_at
+            self.dispatched += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            future.set_result(entry)
+
+    def metrics(self):
+        now = time.monotonic()
+        in_window = [(sent_at, t) for sent_at, t in list(self._sent) if now - sent_at < self.window]
+        return {
+            "queue_depth": sum(len(q) for q in list(self._queues.values())),
+            "queued_tasks": len(self._queues),
+            "dispatched": self.dispatched,
+            "rate_limited": self.rate_limited,
+            "avg_wait_seconds": round(self.total_wait / self.dispatched, 3) if self.dispatched else 0.0,
+            "max_wait_seconds": round(self.max_wait, 3),
+            "requests_last_minute": len(in_window),
+            "tokens_last_minute": sum(t for _, t in in_window),
+            "rpm_limit": self.rpm,
+            "tpm_limit": self.tpm,
+        }
+
+
+def get_scheduler_metrics():
+    return get_scheduler().metrics()
+
+
+@traced()
+def upload_files(client, file_path, expires_in=3600):
+    size = os.path.getsize(file_path)
+    TRANSFER_BYTES.labels("openai", "sent").inc(size)
+    set_attrs(file=os.path.basename(file_path), bytes=size)
     response = client.files.create(
         file=open(file_path, "rb"),
         purpose="assistants",
         expires_after={
             "anchor": "created_at",
-            "seconds": 3600
-        }   
+            "seconds": expires_in
+        }
     )
     return json.loads(response.json())['id']
 
 
-def get_response_from_gpt(client, input_text, file_ids=[], model="gpt-5-nano", enable_web_search=False, label=""):
-    print(f"[{label}] Starting request...")
+async def _upload_file(file_path, expires_in):
+    with open(file_path, "rb") as f:
+        response = await get_async_client().with_options(max_retries=UPLOAD_RETRIES).files.create(
+            file=f,
+            purpose="assistants",
+            expires_after={
+                "anchor": "created_at",
+                "seconds": expires_in
+            }
+        )
+    return response.id
+
+
+@traced("upload_files")
+async def aupload_files(file_path, expires_in=3600):
+    """upload_files on the shared async client, callable from any event loop"""
+    size = os.path.getsize(file_path)
+    TRANSFER_BYTES.labels("openai", "sent").inc(size)
+    set_attrs(file=os.path.basename(file_path), bytes=size)
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_upload_file(file_path, expires_in), _get_loop()))
+
+
+def build_response_body(input_text, file_ids=[], model="gpt-5-nano", enable_web_search=False):
     input_files = []
     tools = []
 
     if file_ids:
         input_files = [{"type": "input_file", "file_id": fid} for fid in file_ids]
-    
+
     if enable_web_search:
         tools=[{"type": "web_search"}]
 
-    response = client.responses.create(
-        model=model,
-        tools=tools,
-        input=[
+    return {
+        "model": model,
+        "tools": tools,
+        "input": [
             {
                 "role": "user",
                 "content": [
@@ -44,7 +263,125 @@ def get_response_from_gpt(client, input_text, file_ids=[], model="gpt-5-nano", e
                 ]
             }
         ]
+    }
+
+
+def extract_output_text(response_body):
+    # raw Responses API payloads (e.g. batch output lines) have no `output_text` helper
+    texts = []
+    for item in response_body.get("output") or []:
+        if item.get("type") != "message":
+            continue
+        for content in item.get("content") or []:
+            if content.get("type") == "output_text":
+                texts.append(content.get("text", ""))
+    return "".join(texts)
+
+
+def estimate_tokens(input_text, file_ids):
+    return len(input_text) // 3 + len(file_ids) * FILE_TOKENS_ESTIMATE + OUTPUT_TOKENS_ESTIMATE
+
+
+def _retry_delay(error, attempt):
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 60) + random.random()
+
+
+async def _stream_response(client, body, on_delta):
+    """Passes text deltas to `on_delta` as they arrive and returns the completed response"""
+    stream = await client.responses.create(**body, stream=True)
+    response = None
+    async for event in stream:
+        if event.type == "response.output_text.delta":
+            on_delta(event.delta)
+        elif event.type in ("response.completed", "response.incomplete"):
+            response = event.response
+        elif event.type == "response.failed":
+            raise RuntimeError(f"Response failed: {event.response.error}")
+        elif event.type == "error":
+            raise RuntimeError(f"Response stream error: {event.message}")
+    if response is None:
+        raise RuntimeError("Response stream ended before completion")
+    return response
+
+
+def _is_transient(error):
+    """Errors the SDK would retry by itself: 5xx, 408/409, timeouts and dropped connections (also mid-stream)"""
+    if isinstance(error, (InternalServerError, APIConnectionError, httpx.TransportError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code in (408, 409)
+
+
+async def _scheduled_response(input_text, file_ids, model, enable_web_search, label, task_key, on_delta):
+    client = get_async_client()
+    scheduler = get_scheduler()
+    body = build_response_body(input_text, file_ids, model, enable_web_search)
+    tokens = estimate_tokens(input_text, file_ids)
+
+    with span("get_response_from_gpt", label=label, model=model, files=len(file_ids)):
+        for attempt in range(MAX_RETRIES + 1):
+            with span("llm_queue"):
+                entry = await scheduler.acquire(task_key or label, tokens)
+            print(f"[{label}] Starting request...")
+            try:
+                with span("llm_request", attempt=attempt):
+                    if on_delta is None:
+                        response = await client.responses.create(**body)
+                    else:
+                        if attempt > 0:
+                            # the retried stream starts the text over
+                            on_delta(None)
+                        response = await _stream_response(client, body, on_delta)
+            except RateLimitError as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = _retry_delay(e, attempt)
+                logger.warning(f"[{label}] Rate limited, retrying in {delay:.1f}s")
+                RETRIES.labels("openai").inc()
+                # the budget is exhausted for every task, not just this one
+                scheduler.pause(delay)
+                continue
+            except Exception as e:
+                if not _is_transient(e) or attempt == MAX_RETRIES:
+                    raise
+                delay = _retry_delay(e, attempt)
+                logger.warning(f"[{label}] {type(e).__name__}: {e}, retrying in {delay:.1f}s")
+                RETRIES.labels("openai").inc()
+                await asyncio.sleep(delay)
+                continue
+
+            if response.usage is not None:
+                scheduler.record_usage(entry, response.usage.total_tokens)
+            record_llm_usage(model, response.usage)
+            print(f"[{label}] Finished request.")
+            return response.output_text
+
+
+def submit_response_from_gpt(input_text, file_ids=[], model="gpt-5-nano", enable_web_search=False, label="",
+                             task_key=None, on_delta=None):
+    """Schedules a request on the shared client, returns concurrent.futures.Future with the output text.
+
+    With `on_delta` the response is streamed and the callback receives text chunks
+    (on the client's event loop thread) as soon as they are generated; None means a retried
+    request starts the text over.
+    """
+    return asyncio.run_coroutine_threadsafe(
+        _scheduled_response(input_text, list(file_ids), model, enable_web_search, label, task_key, on_delta),
+        _get_loop()
     )
-    print(f"[{label}] Finished request.")
 
-    return response.output_text
+
+async def aget_response_from_gpt(input_text, file_ids=[], model="gpt-5-nano", enable_web_search=False, label="",
+                                 task_key=None, on_delta=None):
+    return await asyncio.wrap_future(
+        submit_response_from_gpt(input_text, file_ids, model, enable_web_search, label, task_key, on_delta)
+    )
+
+
+def get_response_from_gpt(input_text, file_ids=[], model="gpt-5-nano", enable_web_search=False, label="",
+                          task_key=None, on_delta=None):
+    return submit_response_from_gpt(input_text, file_ids, model, enable_web_search, label, task_key, on_delta).result()
@@ -0,0 +1,131 @@
+import collections
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Share of tasks profiled without an explicit request, 0 turns sampling off
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# 'sampling' (wall clock stacks of the task thread) or 'cprofile' (deterministic, every call)
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'sampling')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+TOP_N = 30
+
+
+def should_profile(requested=False):
+    return requested or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+def _frame_name(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    """Samples the stacks of the given threads from a background thread.
+
+    Counts wall clock time, so waiting on the portal or on an LLM future shows up too.
+    """
+
+    def __init__(self, thread_ids, interval=PROFILE_INTERVAL):
+        self.thread_ids = set(thread_ids)
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    stack.reverse()
+                    self.stacks[tuple(stack)] += 1
+                    self.samples += 1
+
+    def folded(self):
+        """Stacks in the collapsed format of flamegraph.pl / speedscope: 'root;...;leaf count'"""
+        return ''.join(f'{";".join(stack)} {count}\n' for stack, count in self.stacks.most_common())
+
+    def top(self, n=TOP_N):
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+
+        samples = max(self.samples, 1)
+        lines = [f'{self.samples} samples every {self.interval * 1000:.0f} ms\n',
+                 f'{"own %":>7} {"total %":>7}  function']
+        for name, _ in total.most_common(n):
+            lines.append(f'{own[name] / samples:>7.1%} {total[name] / samples:>7.1%}  {name}')
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def profile(name, out_dir='reports', mode=None):
+    """Profiles the block and saves the result next to the report as <name>.profile.*
+
+    Yields the list of written file names, filled in when the block exits.
+    """
+    mode = mode or PROFILE_MODE
+    files = []
+    started_at = time.perf_counter()
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = SamplingProfiler([threading.get_ident()])
+        profiler.start()
+
+    try:
+        yield files
+    finally:
+        elapsed = time.perf_counter() - started_at
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, f'{name}.profile')
+
+        if mode == 'cprofile':
+            profiler.disable()
+            # .prof opens in snakeviz / flameprof, the text is the top of cumulative time
+            profiler.dump_stats(base + '.prof')
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(TOP_N)
+            files.append(base + '.prof')
+            top = text.getvalue()
+        else:
+            profiler.stop()
+            with open(base + '.folded', 'w', encoding='utf-8') as f:
+                f.write(profiler.folded())
+            files.append(base + '.folded')
+            top = profiler.top()
+
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(f'{name}: {elapsed:.2f}s wall, mode {mode}\n\n{top}')
+        files.append(base + '.txt')
+        files[:] = [os.path.basename(path) for path in files]
+
+
+def maybe_profile(name, enabled, out_dir='reports'):
+    """`profile` when enabled, otherwise a no-op context so the off path costs nothing"""
+    return profile(name, out_dir) if enabled else nullcontext([])
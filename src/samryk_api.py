@@ -0,0 +1,278 @@
+import os
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from requests import Session
+from src.goszakup_parser import send_request
+from src.models import Tender, Lot, TechspecFile, parse_amount
+from src.sources import SourceAdapter
+
+logger = logging.getLogger(__name__)
+
+# zakup.sk.kz is an Angular SPA, the data comes from these JSON endpoints
+SAMRUK_URL = os.environ.get('SAMRUK_URL', 'https://zakup.sk.kz')
+ADVERTS_URL = '/eprocsearch/api/external/adverts'
+ADVERT_URL = '/eprocsearch/api/external/adverts/{advert_id}'
+LOTS_URL = '/eprocsearch/api/external/adverts/{advert_id}/lots'
+FILES_URL = '/eprocsearch/api/external/adverts/{advert_id}/files'
+FILE_DOWNLOAD_URL = '/eprocfilestorage/api/external/files/{file_id}/download'
+
+PAGE_SIZE = 100
+
+# same filters as https://zakup.sk.kz/#/ext?tabs=advert&pfrom=10000000&adst=PUBLISHED&lst=PUBLISHED
+DEFAULT_FILTERS = {
+    'priceFrom': 10000000,
+    'advertStatus': 'PUBLISHED',
+    'lotStatus': 'PUBLISHED',
+}
+
+headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/119.0',
+    'Accept': 'application/json',
+    'Referer': 'https://zakup.sk.kz/',
+}
+
+# key of samryk_parser.parse_advert_data output -> JSON path
+ADVERT_FIELDS = {
+    'Заголовок': 'nameRu',
+    'Заказчик': 'customer.nameRu',
+    'МЕТОД ЗАКУПКИ': 'tenderType.nameRu',
+    'Приоритет': 'priority.nameRu',
+    'Общая сумма лотов': 'sumTruNoNds',
+    'Электронная почта': 'contact.email',
+    'Телефон': 'contact.phone',
+    'Внутренний номер': 'internalNumber',
+    'Начало приема заявок': 'acceptanceBeginDateTime',
+    'Конец приема заявок': 'acceptanceEndDateTime',
+}
+
+# ISO datetimes of the API, shown on the page as dd.mm.yyyy hh:mm
+DATE_FIELDS = ('Начало приема заявок', 'Конец приема заявок')
+PAGE_DATE_FORMAT = '%d.%m.%Y %H:%M'
+
+LOT_FIELDS = {
+    'Наименование': 'truName',
+    'Характеристика': 'truDescription',
+    'Количество': 'count',
+    'Ед. измерения': 'mkeiShort',
+    'Место поставки': 'deliveryPlace',
+    'Сроки': 'deliveryTerm',
+    'Цена за ед.': 'price',
+    'Сумма': 'sumTruNoNds',
+}
+
+
+def get_session():
+    session = Session()
+    session.headers.update(headers)
+    return session
+
+
+def _get_path(obj, path):
+    for key in path.split('.'):
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(key)
+    return obj
+
+
+def _to_text(value):
+    if value is None:
+        return None
+    return str(value).strip()
+
+
+def _to_page_date(value):
+    try:
+        return datetime.fromisoformat(value).strftime(PAGE_DATE_FORMAT)
+    except (TypeError, ValueError):
+        return value
+
+
+def _get_json(session, path, **params):
+    response = send_request(session, SAMRUK_URL + path, method='get', params=params or None)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_adverts_page(session, page, filters=DEFAULT_FILTERS):
+    """Returns (advert ids on the page, total pages); `page` starts from 1 like on the site"""
+    data = _get_json(session, ADVERTS_URL, page=page - 1, size=PAGE_SIZE, **filters)
+    advert_ids = [str(item['id']) for item in data.get('content', [])]
+    return advert_ids, data.get('totalPages', 1)
+
+
+def list_advert_ids(session, filters=DEFAULT_FILTERS, max_pages=None):
+    advert_ids, total_pages = get_adverts_page(session, 1, filters)
+    if max_pages is not None:
+        total_pages = min(total_pages, max_pages)
+
+    for page in range(2, total_pages + 1):
+        logger.info(f'parsing {page} out of {total_pages}')
+        page_ids, _ = get_adverts_page(session, page, filters)
+        advert_ids.extend(page_ids)
+
+    return advert_ids
+
+
+def convert_lot(lot_json):
+    lot = {
+        # not shown on the page, samryk_parser lots have it only inside 'Номер'
+        'lot_id': _to_text(lot_json.get('id')),
+        'Номер': _to_text(
+            f"{lot_json.get('lotNumber')} ({lot_json.get('lotCode')}, {lot_json.get('id')})"
+            if lot_json.get('lotCode') else lot_json.get('lotNumber')
+        ),
+    }
+    for key, path in LOT_FIELDS.items():
+        lot[key] = _to_text(_get_path(lot_json, path))
+    return lot
+
+
+def convert_advert(advert_json, lots_json):
+    """Same shape as samryk_parser.parse_advert_data, plus 'lot_id' in the lots"""
+    data = {key: _to_text(_get_path(advert_json, path)) for key, path in ADVERT_FIELDS.items()}
+    for key in DATE_FIELDS:
+        data[key] = _to_page_date(data[key])
+    data['Лоты'] = [convert_lot(lot) for lot in lots_json]
+    return data
+
+
+def get_advert_lots(session, advert_id):
+    data = _get_json(session, LOTS_URL.format(advert_id=advert_id))
+    return data.get('content', data) if isinstance(data, dict) else data
+
+
+def get_advert_files(session, advert_id):
+    data = _get_json(session, FILES_URL.format(advert_id=advert_id))
+    files = data.get('content', data) if isinstance(data, dict) else data
+    return [
+        {
+            'file_id': str(item['id']),
+            'file_name': item.get('fileName') or item.get('name') or str(item['id']),
+            'lot_id': _to_text(item.get('lotId')),
+        }
+        for item in files
+    ]
+
+
+def get_advert(session, advert_id):
+    advert_json = _get_json(session, ADVERT_URL.format(advert_id=advert_id))
+    lots_json = get_advert_lots(session, advert_id)
+    return convert_advert(advert_json, lots_json)
+
+
+def download_files(session, files_info, save_dir='sk_downloads'):
+    os.makedirs(save_dir, exist_ok=True)
+
+    paths = []
+    for item in files_info:
+        response = send_request(session, SAMRUK_URL + FILE_DOWNLOAD_URL.format(file_id=item['file_id']), method='get')
+        response.raise_for_status()
+        filepath = os.path.join(save_dir, os.path.basename(item['file_name']))
+        with open(filepath, 'wb') as f:
+            f.write(response.content)
+        logger.info(f'Saved to {filepath}')
+        paths.append(filepath)
+
+    return paths
+
+
+def parse_advert_data_and_download_techspec(session, advert_id, save_dir='sk_downloads'):
+    """HTTP-only replacement of samryk_parser.parse_advert_data_and_download_techspec"""
+    advert_data = get_advert(session, advert_id)
+    files = get_advert_files(session, advert_id)
+    advert_data['Файлы'] = download_files(session, files, os.path.join(save_dir, str(advert_id)))
+    return advert_data
+
+
+def get_adverts(session, advert_ids, max_workers=8):
+    """{advert_id: advert data}; adverts that failed to load are logged and skipped"""
+    def fetch(advert_id):
+        try:
+            return advert_id, get_advert(session, advert_id)
+        except Exception as e:
+            logger.error(f'Failed to load advert {advert_id}: {e}')
+            return advert_id, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return {advert_id: data for advert_id, data in executor.map(fetch, advert_ids) if data is not None}
+
+
+def lot_id_from_number(number):
+    """'1 (2074-1 Т, 4221402)' -> '4221402'"""
+    match = re.search(r',\s*(\d+)\)$', number or '')
+    return match.group(1) if match else None
+
+
+def tender_from_samruk(advert_id, data, files=()):
+    """data in the samryk_parser.parse_advert_data shape (Russian keys)"""
+    return Tender(
+        source='samruk',
+        tender_id=str(advert_id),
+        name=data.get('Заголовок'),
+        organizer_name=data.get('Заказчик'),
+        procurement_method=data.get('МЕТОД ЗАКУПКИ'),
+        application_start_date=data.get('Начало приема заявок'),
+        application_end_date=data.get('Конец приема заявок'),
+        amount=parse_amount(data.get('Общая сумма лотов')),
+        lots=[
+            Lot(
+                lot_id=lot.get('lot_id') or lot_id_from_number(lot.get('Номер')),
+                lot_number=lot.get('Номер'),
+                name=lot.get('Наименование'),
+                description=lot.get('Характеристика'),
+                customer=data.get('Заказчик'),
+                unit_price=parse_amount(lot.get('Цена за ед.')),
+                quantity=parse_amount(lot.get('Количество')),
+                unit_of_measure=lot.get('Ед. измерения'),
+                amount=parse_amount(lot.get('Сумма')),
+                delivery_place=lot.get('Место поставки'),
+                delivery_term=lot.get('Сроки'),
+            )
+            for lot in data.get('Лоты', [])
+        ],
+        techspec_files=[
+            TechspecFile(
+                file_name=f['file_name'],
+                file_link=SAMRUK_URL + FILE_DOWNLOAD_URL.format(file_id=f['file_id']),
+                lot_id=f.get('lot_id'),
+            )
+            for f in files
+        ],
+    )
+
+
+class SamrukAdapter(SourceAdapter):
+    source = 'samruk'
+
+    def __init__(self, session=None, filters=DEFAULT_FILTERS):
+        self.session = session or get_session()
+        self.filters = filters
+
+    def list_tender_ids(self, max_pages=None):
+        return list_advert_ids(self.session, self.filters, max_pages)
+
+    def count_listing_pages(self):
+        return get_adverts_page(self.session, 1, self.filters)[1]
+
+    def list_tender_ids_page(self, page):
+        return get_adverts_page(self.session, page, self.filters)[0]
+
+    def fetch_tender(self, tender_id):
+        return tender_from_samruk(
+            tender_id,
+            get_advert(self.session, tender_id),
+            get_advert_files(self.session, tender_id),
+        )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    session = get_session()
+
+    tender_ids_clean = list_advert_ids(session)
+    logger.info(f'Found {len(tender_ids_clean)} adverts')
+
+    result = parse_advert_data_and_download_techspec(session, 1164921)
@@ -2,36 +2,71 @@ import time
 import logging
 import json
 import os
+import queue
+import threading
 from bs4 import BeautifulSoup
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 # ------------------------------------------------------------------
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
 # ------------------------------------------------------------------
-from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.common.exceptions import TimeoutException, WebDriverException, StaleElementReferenceException
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 
+logger = logging.getLogger(__name__)
 
-def get_driver():
+
+# Angular adds `ng-star-inserted` to components once they are rendered
+LISTING_ITEM = (By.CSS_SELECTOR, 'div.m-found-item__num.ng-star-inserted')
+LISTING_EMPTY = (By.CSS_SELECTOR, 'div.m-sidebar__empty')
+MODAL_CONTENT = (By.CSS_SELECTOR, 'div.modal-content')
+MODAL_TITLE = (By.CSS_SELECTOR, 'div.modal-content div.m-modal__title')
+MODAL_BODY = (By.CSS_SELECTOR, 'div.m-modal__body.ng-star-inserted')
+FILE_LINK = (By.CSS_SELECTOR, 'div.d-flex.fileLink')
+
+TIMEOUT = 10
+DOWNLOAD_TIMEOUT = 60
+LISTING_URL = 'https://zakup.sk.kz/#/ext?tabs=advert&pfrom=10000000&adst=PUBLISHED&lst=PUBLISHED&page={page_i}'
+
+DOWNLOAD_MIME_TYPES = ','.join([
+    'application/pdf',
+    'application/octet-stream',
+    'application/zip',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.ms-excel',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+])
+
+
+def get_driver(download_dir='sk_downloads', headless=True):
     # 1. Initialize Firefox Options
     firefox_options = FirefoxOptions()
 
     firefox_options.add_argument("-private") # Equivalent to --incognito/private mode
+    if headless:
+        firefox_options.add_argument("-headless")
 
     # 2. Configure Profile Preferences (Prefs)
-    download_dir = 'sk_downloads'
+    download_dir = os.path.abspath(download_dir)  # Firefox ignores relative download paths
+    os.makedirs(download_dir, exist_ok=True)
     firefox_options.set_preference("browser.download.folderList", 2) # 0=desktop, 1=downloads, 2=custom
     firefox_options.set_preference("browser.download.dir", download_dir)
     firefox_options.set_preference("browser.download.useDownloadDir", True)
     firefox_options.set_preference("browser.download.manager.showWhenStarting", False)
+    firefox_options.set_preference("browser.helperApps.neverAsk.saveToDisk", DOWNLOAD_MIME_TYPES)
     firefox_options.set_preference("pdfjs.disabled", True) # Disable built-in PDF viewer
 
-    firefox_options.set_preference("permissions.default.image", 2) # 1=Allow, 2=Block (This may not work universally depending on Firefox version/setup)
+    # Nothing is parsed from images and fonts, don't waste traffic and memory on them
+    firefox_options.set_preference("permissions.default.image", 2) # 1=Allow, 2=Block
+    firefox_options.set_preference("gfx.downloadable_fonts.enabled", False)
+    firefox_options.set_preference("browser.display.use_document_fonts", 0)
     user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/119.0"
     firefox_options.set_preference("general.useragent.override", user_agent)
 
     driver = webdriver.Firefox(options=firefox_options)
+    return driver
 
 
 def get_text(element):
@@ -137,21 +172,83 @@ def parse_advert_data(driver):
     return data
 
 
-def parse_advert_data_and_download_techspec(driver, advert_id):
-    
-    TIMEOUT = 10
+def wait_for_download(download_dir, known_files, timeout=DOWNLOAD_TIMEOUT):
+    """Waits until a new completely downloaded file appears in download_dir"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        current = set(os.listdir(download_dir))
+        new_files = [f for f in current - known_files if not f.endswith('.part')]
+        in_progress = [f for f in current if f.endswith('.part')]
+        if new_files and not in_progress:
+            return new_files
+        time.sleep(0.2)
+    raise TimeoutException(f'Download to {download_dir} did not finish in {timeout}s')
+
+
+def _replaced(old, old_text):
+    """Wait condition: the element was removed from the DOM or re-rendered with other content"""
+    def condition(driver):
+        try:
+            return old.text != old_text
+        except StaleElementReferenceException:
+            return True
+    return condition
+
+
+def navigate(driver, url, *locators):
+    """driver.get that also waits for the previous page to go away.
+
+    Listing pages and adverts differ only after '#', so on a reused driver the navigation doesn't reload
+    the page and the old DOM would satisfy the waits for the new one. The first element matching
+    `locators` is captured before navigating and waited on until it is replaced.
+    """
+    if driver.current_url == url:
+        # same hash, no navigation would happen at all
+        driver.get('about:blank')
+    old = next((elements[0] for elements in (driver.find_elements(*locator) for locator in locators) if elements),
+               None)
+    old_text = old.text if old is not None else None
+    driver.get(url)
+    if old is not None:
+        WebDriverWait(driver, TIMEOUT).until(_replaced(old, old_text))
+
+
+def parse_listing_page(driver, page_i, download_dir=None):
+    navigate(driver, LISTING_URL.format(page_i=page_i), LISTING_ITEM, LISTING_EMPTY)
+    try:
+        WebDriverWait(driver, TIMEOUT).until(
+            EC.any_of(
+                EC.presence_of_element_located(LISTING_ITEM),
+                EC.presence_of_element_located(LISTING_EMPTY),
+            )
+        )
+    except TimeoutException:
+        logger.warning(f'Listing page {page_i} did not render in {TIMEOUT}s')
+        return []
+
+    soup = BeautifulSoup(driver.page_source, 'html.parser')
+    lots_ids_on_page = []
+    lots_on_page = soup.find_all('div', class_='m-sidebar__layout m-sidebar__layout--found-item ng-star-inserted')
+    for lot in lots_on_page:
+        lot_id = lot.find('div', class_='m-found-item__num ng-star-inserted').get_text(strip=True)
+        lots_ids_on_page.append(lot_id.strip('№ '))
+    return lots_ids_on_page
+
+
+def parse_advert_data_and_download_techspec(driver, advert_id, download_dir='sk_downloads'):
 
     base_url = "https://zakup.sk.kz/#/ext(popup:item/{advert_id}/advert)"
     url = base_url.format(advert_id=advert_id)
-    driver.get(url)
-    time.sleep(1)
-    print('parsing advert data')
+    navigate(driver, url, MODAL_CONTENT)
+    WebDriverWait(driver, TIMEOUT).until(
+        EC.presence_of_element_located(MODAL_TITLE)
+    )
+    logger.info(f'parsing advert data {advert_id}')
     advert_data = parse_advert_data(driver)
 
-    print('parsing advert files')
-    PARENT_CONTAINER = (By.CSS_SELECTOR, 'div.m-modal__body.ng-star-inserted')
+    logger.info(f'parsing advert files {advert_id}')
     WebDriverWait(driver, TIMEOUT).until(
-        EC.presence_of_element_located(PARENT_CONTAINER)
+        EC.presence_of_element_located(MODAL_BODY)
     )
 
     elements_to_click = driver.find_elements(
@@ -159,40 +256,122 @@ def parse_advert_data_and_download_techspec(driver, advert_id):
         "//div[@class='m-modal__body ng-star-inserted']//span[contains(@class, 'link--active')]"
     )
 
+    download_dir = os.path.abspath(download_dir)
+    advert_data['Файлы'] = []
     for element in elements_to_click:
         element.click()
-        NEW_ELEMENT_LOCATOR = (By.CSS_SELECTOR, 'div.d-flex.fileLink')
-        container_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located(NEW_ELEMENT_LOCATOR)
+        container_element = WebDriverWait(driver, TIMEOUT).until(
+            EC.presence_of_element_located(FILE_LINK)
         )
         anchor_to_click = container_element.find_element(By.TAG_NAME, 'a')
+        known_files = set(os.listdir(download_dir))
         anchor_to_click.click()
-        time.sleep(2)
+        advert_data['Файлы'].extend(
+            os.path.join(download_dir, f) for f in wait_for_download(download_dir, known_files)
+        )
     
     return advert_data
 
 
-# main function
-lots_ids = []
-driver = get_driver()
+class BrowserPool:
+    """Headless Firefox workers, each with its own download directory.
 
-for page_i in range(1, 62):
-    print(f'Parsing page {page_i}')
-    driver.get(
-        f'https://zakup.sk.kz/#/ext?tabs=advert&pfrom=10000000&adst=PUBLISHED&lst=PUBLISHED&page={page_i}'
-    )
-    time.sleep(2)
-    page_source = driver.page_source
-    soup = BeautifulSoup(page_source, 'html.parser')
-    lots_ids_on_page = []
-    lots_on_page = soup.find_all('div', class_='m-sidebar__layout m-sidebar__layout--found-item ng-star-inserted')
-    for lot in lots_on_page:
-        lot_id = lot.find('div', class_='m-found-item__num ng-star-inserted').get_text(strip=True)
-        lots_ids_on_page.append(lot_id)
-    # lots_on_page[0].find('div', class_='m-found-item__num ng-star-inserted').get_text(strip=True)
-    lots_ids.extend(lots_ids_on_page)
+    A driver is restarted after `max_pages` pages to cap the memory growth of a long-lived
+    browser process.
+    """
+
+    def __init__(self, size=4, download_dir='sk_downloads', max_pages=50, headless=True):
+        self.size = size
+        self.download_dir = download_dir
+        self.max_pages = max_pages
+        self.headless = headless
+        self._drivers = [None] * size
+        self._pages = [0] * size
+
+    def worker_download_dir(self, worker_id):
+        return os.path.join(self.download_dir, f'worker_{worker_id}')
+
+    def _get_driver(self, worker_id):
+        if self._drivers[worker_id] is not None and self._pages[worker_id] >= self.max_pages:
+            logger.info(f'Recycling driver of worker {worker_id} after {self._pages[worker_id]} pages')
+            self._quit_driver(worker_id)
+        if self._drivers[worker_id] is None:
+            self._drivers[worker_id] = get_driver(self.worker_download_dir(worker_id), self.headless)
+            self._pages[worker_id] = 0
+        return self._drivers[worker_id]
+
+    def _quit_driver(self, worker_id):
+        driver = self._drivers[worker_id]
+        self._drivers[worker_id] = None
+        if driver is not None:
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+
+    def _run_worker(self, worker_id, work_queue, func, results):
+        while True:
+            try:
+                index, item = work_queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                driver = self._get_driver(worker_id)
+                results[index] = func(driver, item, self.worker_download_dir(worker_id))
+            except Exception as e:
+                # parse errors too (a modal missing fields): an uncaught one would kill the thread with its browser
+                logger.error(f'Worker {worker_id} failed on {item}: {e!r}', exc_info=not isinstance(e, WebDriverException))
+                results[index] = None
+                # the browser may be left in a broken state, start the next item with a fresh one
+                self._quit_driver(worker_id)
+            self._pages[worker_id] += 1
+
+    def map(self, func, items):
+        """Shards items across workers, func(driver, item, download_dir); failed items give None"""
+        items = list(items)
+        work_queue = queue.Queue()
+        for index, item in enumerate(items):
+            work_queue.put((index, item))
+
+        results = [None] * len(items)
+        threads = [
+            threading.Thread(target=self._run_worker, args=(worker_id, work_queue, func, results), daemon=True)
+            for worker_id in range(min(self.size, len(items)))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def close(self):
+        for worker_id in range(self.size):
+            self._quit_driver(worker_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def crawl_listing(pool, pages):
+    tender_ids = []
+    for ids_on_page in pool.map(parse_listing_page, pages):
+        tender_ids.extend(ids_on_page or [])
+    return tender_ids
+
+
+def parse_adverts(pool, advert_ids):
+    return dict(zip(advert_ids, pool.map(parse_advert_data_and_download_techspec, advert_ids)))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
 
-tender_ids_clean = [lot.strip('№ ') for lot in lots_ids]
+    with BrowserPool(size=4) as pool:
+        tender_ids_clean = crawl_listing(pool, range(1, 62))
+        logger.info(f'Found {len(tender_ids_clean)} adverts')
 
-# parse by id
-result = parse_advert_data_and_download_techspec(driver, 1164921)
\ No newline at end of file
+        # parse by id
+        result = parse_adverts(pool, [1164921])
@@ -0,0 +1,36 @@
+from abc import ABC, abstractmethod
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SourceAdapter(ABC):
+    """Common interface of procurement portals, produces src.models.Tender records"""
+
+    source = None
+
+    @abstractmethod
+    def list_tender_ids(self, max_pages=None):
+        """Ids of the adverts currently listed on the portal"""
+
+    @abstractmethod
+    def count_listing_pages(self):
+        """Number of listing pages, a crawl is split into work units per page"""
+
+    @abstractmethod
+    def list_tender_ids_page(self, page):
+        """Ids of the adverts on one listing page, `page` starts from 1"""
+
+    @abstractmethod
+    def fetch_tender(self, tender_id):
+        """Full advert with lots and techspec files as a Tender"""
+
+    def iter_tenders(self, tender_ids=None):
+        """Yields Tenders, skipping the adverts that failed to load"""
+        if tender_ids is None:
+            tender_ids = self.list_tender_ids()
+        for tender_id in tender_ids:
+            try:
+                yield self.fetch_tender(tender_id)
+            except Exception as e:
+                logger.error(f'[{self.source}] Failed to load {tender_id}: {e}')
@@ -0,0 +1,211 @@
+import collections
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zipfile
+from html import unescape
+
+logger = logging.getLogger(__name__)
+
+# Near-duplicate techspecs across adverts: MinHash signatures of word shingles, LSH buckets for lookup
+TECHSPEC_INDEX_PATH = os.environ.get('TECHSPEC_INDEX_PATH', os.path.join('reports', 'techspec_index.jsonl'))
+# Estimated Jaccard from which the analyses of the matched report are reused instead of asking the LLM;
+# above 1 turns reuse off
+TECHSPEC_REUSE_THRESHOLD = float(os.environ.get('TECHSPEC_REUSE_THRESHOLD', 0.95))
+SIMILAR_TOP_K = int(os.environ.get('TECHSPEC_SIMILAR_TOP_K', 5))
+
+# Bins of the one-permutation MinHash signature
+SIGNATURE_SIZE = 128
+# 32 bands of 4 rows: pairs with Jaccard around 0.42 and above become candidates
+BANDS = 32
+ROWS = SIGNATURE_SIZE // BANDS
+SHINGLE_WORDS = 4
+
+# Densified empty bins get the borrowed value shifted by distance * this, so they only match
+# bins that borrowed from the same distance
+_DENSIFY_STEP = 1 << 58
+# Most recent adverts taken from each bucket and candidates (by number of shared bands) whose Jaccard
+# is estimated; bounds the query when thousands of adverts share one techspec
+MAX_CANDIDATES = 64
+
+_WORD_RE = re.compile(r'\w+')
+_XML_PARAGRAPH_RE = re.compile(r'</w:p>')
+_XML_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def extract_text(path):
+    """Plain text of a downloaded techspec; '' for formats that cannot be read here"""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == '.docx':
+            with zipfile.ZipFile(path) as docx:
+                xml = docx.read('word/document.xml').decode('utf-8')
+            return unescape(_XML_TAG_RE.sub('', _XML_PARAGRAPH_RE.sub('\n', xml)))
+        if ext == '.pdf':
+            try:
+                from pypdf import PdfReader
+            except ImportError:
+                logger.warning(f'pypdf is not installed, {path} is left out of the techspec index')
+                return ''
+            return '\n'.join(page.extract_text() or '' for page in PdfReader(path).pages)
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8')
+    except (OSError, UnicodeDecodeError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        logger.warning(f'Cannot read text of {path}: {e}')
+        return ''
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(items):
+    """One-permutation MinHash signature of a set of strings.
+
+    Each item is hashed once (64-bit blake2b) into one of SIGNATURE_SIZE bins by its low bits and bins keep
+    their minimum, so the cost is linear in the number of shingles instead of SIGNATURE_SIZE hashes per item.
+    Empty bins borrow from the next non-empty bin to the right (rotation densification).
+    """
+    bins = [None] * SIGNATURE_SIZE
+    for item in items:
+        h = int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'little')
+        i = h % SIGNATURE_SIZE
+        value = h // SIGNATURE_SIZE
+        if bins[i] is None or value < bins[i]:
+            bins[i] = value
+    if all(value is None for value in bins):
+        return None
+
+    signature = []
+    for i in range(SIGNATURE_SIZE):
+        distance = 0
+        while bins[(i + distance) % SIGNATURE_SIZE] is None:
+            distance += 1
+        signature.append(bins[(i + distance) % SIGNATURE_SIZE] + distance * _DENSIFY_STEP)
+    return signature
+
+
+def techspec_signature(paths):
+    """Signature of the techspec files of one advert taken together; None if they have no text.
+
+    Module-level and picklable so it runs in the parse pool like the page parsers.
+    """
+    text = '\n'.join(extract_text(path) for path in sorted(paths))
+    return minhash(shingles(text))
+
+
+def jaccard(sig_a, sig_b):
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / SIGNATURE_SIZE
+
+
+def _band_keys(signature):
+    return [hash(tuple(signature[i * ROWS:(i + 1) * ROWS])) for i in range(BANDS)]
+
+
+def _match(entry, score):
+    match = {key: value for key, value in entry.items() if key not in ('signature', 'indexed_at')}
+    match['jaccard'] = round(score, 3)
+    return match
+
+
+class TechspecIndex:
+    """Incremental MinHash LSH index of techspecs, persisted as an append-only JSONL file.
+
+    Every add appends a line, the last line of an advert wins on load.
+    """
+
+    def __init__(self, path=TECHSPEC_INDEX_PATH):
+        self.path = path
+        self.entries = {}
+        self.buckets = [{} for _ in range(BANDS)]
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        lines = 0
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut off by a crash
+                    continue
+                self._insert(entry)
+        if lines > 2 * len(self.entries):
+            self._compact()
+
+    def _compact(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def _insert(self, entry):
+        advert_id = str(entry['advert_id'])
+        self._remove(advert_id)
+        self.entries[advert_id] = entry
+        for bucket, key in zip(self.buckets, _band_keys(entry['signature'])):
+            # dict as an insertion-ordered set, the newest adverts are at the end
+            bucket.setdefault(key, {})[advert_id] = None
+
+    def _remove(self, advert_id):
+        old = self.entries.pop(advert_id, None)
+        if old is None:
+            return
+        for bucket, key in zip(self.buckets, _band_keys(old['signature'])):
+            ids = bucket.get(key)
+            if ids is not None:
+                ids.pop(advert_id, None)
+                if not ids:
+                    del bucket[key]
+
+    def add(self, advert_id, signature, **attrs):
+        """Indexes (or re-indexes) the techspec of an advert; attrs (organizer_bin, ...) come back with matches"""
+        entry = {'advert_id': str(advert_id), **attrs, 'indexed_at': time.time(), 'signature': signature}
+        with self._lock:
+            self._insert(entry)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def query(self, signature, k=SIMILAR_TOP_K, exclude=None):
+        """Top-k indexed adverts sharing an LSH bucket with the signature, by estimated Jaccard"""
+        with self._lock:
+            shared_bands = collections.Counter()
+            for bucket, key in zip(self.buckets, _band_keys(signature)):
+                shared_bands.update(itertools.islice(reversed(bucket.get(key, {})), MAX_CANDIDATES))
+            shared_bands.pop(None if exclude is None else str(exclude), None)
+            scored = [(jaccard(signature, self.entries[advert_id]['signature']), self.entries[advert_id])
+                      for advert_id, _ in shared_bands.most_common(max(MAX_CANDIDATES, k))]
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [_match(entry, score) for score, entry in scored[:k]]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_techspec_index():
+    """Shared index of the process, loaded from TECHSPEC_INDEX_PATH on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = TechspecIndex()
+            logger.info(f'Techspec index: {len(_index)} adverts from {_index.path}')
+        return _index
@@ -0,0 +1,114 @@
+import time
+import pytest
+from src.crawl_coordinator import CrawlCoordinator, run_worker, seed
+from src.models import Tender
+
+CRAWL = 'test'
+
+
+class FakeAdapter:
+    """Two listing pages of three adverts; adverts in `failing` raise"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.fetched = []
+
+    def count_listing_pages(self):
+        return 2
+
+    def list_tender_ids_page(self, page):
+        return [f'{page}0{i}' for i in range(1, 4)]
+
+    def fetch_tender(self, tender_id):
+        self.fetched.append(tender_id)
+        if tender_id in self.failing:
+            raise ConnectionError('portal is down')
+        return Tender(source='fake', tender_id=tender_id)
+
+
+@pytest.fixture
+def coordinator(tmp_path):
+    return CrawlCoordinator(str(tmp_path / 'crawl.sqlite3'), lease_seconds=1, max_attempts=2, retry_delay=0.5)
+
+
+def test_claim_leases_listing_pages_first(coordinator):
+    coordinator.add_units(CRAWL, 'advert', ['1'])
+    coordinator.add_units(CRAWL, 'listing', [1])
+
+    first, = coordinator.claim(CRAWL, 'a')
+    second, = coordinator.claim(CRAWL, 'b')
+    assert (first['kind'], second['kind']) == ('listing', 'advert')
+    assert coordinator.claim(CRAWL, 'c') == []
+    assert coordinator.counts(CRAWL) == {'listing': {'leased': 1}, 'advert': {'leased': 1}}
+
+
+def test_expired_lease_is_reclaimed_and_first_result_wins(coordinator):
+    coordinator.add_units(CRAWL, 'advert', ['1'])
+    unit, = coordinator.claim(CRAWL, 'a')
+
+    time.sleep(1.1)
+    reclaimed, = coordinator.claim(CRAWL, 'b')
+    assert reclaimed['unit_id'] == unit['unit_id']
+    assert reclaimed['attempts'] == 2
+
+    assert coordinator.complete(unit['unit_id'], 'b', {'by': 'b'})
+    # the late first owner and a repeated completion change nothing
+    assert not coordinator.complete(unit['unit_id'], 'a', {'by': 'a'})
+    assert not coordinator.complete(unit['unit_id'], 'b', {'by': 'b again'})
+    assert list(coordinator.results(CRAWL)) == [('1', {'by': 'b'})]
+
+
+def test_heartbeat_keeps_the_lease(coordinator):
+    coordinator.add_units(CRAWL, 'advert', ['1'])
+    coordinator.claim(CRAWL, 'a')
+
+    for _ in range(3):
+        time.sleep(0.5)
+        assert coordinator.heartbeat('a') == 1
+    assert coordinator.claim(CRAWL, 'b') == []
+
+
+def test_released_unit_backs_off_then_fails_after_max_attempts(coordinator):
+    coordinator.add_units(CRAWL, 'advert', ['1'])
+
+    unit, = coordinator.claim(CRAWL, 'a')
+    coordinator.release(unit['unit_id'], 'a', error='500')
+    # not claimable before attempts * retry_delay
+    assert coordinator.claim(CRAWL, 'a') == []
+    time.sleep(0.6)
+
+    unit, = coordinator.claim(CRAWL, 'a')
+    assert unit['attempts'] == 2
+    coordinator.release(unit['unit_id'], 'a', error='500')
+    assert coordinator.counts(CRAWL) == {'advert': {'failed': 1}}
+    assert coordinator.is_finished(CRAWL)
+
+
+def test_expired_lease_fails_after_max_attempts(coordinator):
+    coordinator.add_units(CRAWL, 'advert', ['1'])
+    coordinator.claim(CRAWL, 'a')
+    time.sleep(1.1)
+    coordinator.claim(CRAWL, 'b')
+    time.sleep(1.1)
+
+    assert coordinator.claim(CRAWL, 'c') == []
+    assert coordinator.counts(CRAWL) == {'advert': {'failed': 1}}
+
+
+def test_seed_is_idempotent(coordinator):
+    adapter = FakeAdapter()
+    assert seed(coordinator, adapter, CRAWL) == 2
+    assert seed(coordinator, adapter, CRAWL) == 2
+    assert coordinator.counts(CRAWL) == {'listing': {'pending': 2}}
+
+
+def test_worker_crawls_listing_and_adverts(coordinator):
+    adapter = FakeAdapter(failing={'102'})
+    seed(coordinator, adapter, CRAWL)
+
+    done = run_worker(coordinator, adapter, CRAWL, 'a', idle_wait=0.1)
+
+    assert done == 2 + 5
+    assert coordinator.counts(CRAWL) == {'listing': {'done': 2}, 'advert': {'done': 5, 'failed': 1}}
+    assert adapter.fetched.count('102') == 2
+    assert sorted(item for item, _ in coordinator.results(CRAWL)) == ['101', '103', '201', '202', '203']
@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from prometheus_client import REGISTRY
+from benchmarks.mock_server import MockState
+from src import goszakup_parser as gp
+from src.metrics import start_trace
+
+NESTED = ('parse_advert_view_info', 'parse_obshie_svedeniya', 'parse_organizator_info')
+
+
+@pytest.fixture(params=[0, 1], ids=['inline', 'process-pool'])
+def parse_processes(request, monkeypatch):
+    monkeypatch.setattr(gp, 'PARSE_PROCESSES', request.param)
+    monkeypatch.setattr(gp, '_parse_executor', None)
+    yield request.param
+    if gp._parse_executor is not None:
+        gp._parse_executor.shutdown()
+
+
+@pytest.fixture
+def general_page():
+    return MockState().fixtures['general'].replace('{{BASE_URL}}', 'http://mock').replace('{{ADVERT_ID}}', '1').encode()
+
+
+def observed(stage):
+    return REGISTRY.get_sample_value('tender_stage_duration_seconds_count', {'stage': stage}) or 0
+
+
+def nested_names(trace):
+    parse_span, = [child for child in trace['children'] if child['name'] == 'parse_general_page']
+    return [child['name'] for child in parse_span['children']]
+
+
+def test_run_parser_reports_nested_spans(parse_processes, general_page):
+    before = {stage: observed(stage) for stage in NESTED}
+    with start_trace('task') as trace:
+        result = gp.run_parser(gp.parse_general_page, general_page)
+
+    assert result['organizer_name']
+    assert sorted(nested_names(trace)) == sorted(NESTED)
+    assert all(observed(stage) == before[stage] + 1 for stage in NESTED)
+
+
+def test_arun_parser_reports_nested_spans(parse_processes, general_page):
+    async def parse():
+        with start_trace('task') as trace:
+            await gp.arun_parser(gp.parse_general_page, general_page)
+        return trace
+
+    assert sorted(nested_names(asyncio.run(parse()))) == sorted(NESTED)
@@ -0,0 +1,100 @@
+import json
+import os
+import pytest
+from openai import OpenAI
+from requests import Session
+from batch_main import PROMPTS, make_prepare_advert
+from benchmarks.mock_server import MockServer
+from src import goszakup_parser as gp
+from src.openai_batch import run_batch_analysis, BATCH_FILE_TTL
+
+ADVERT_ID = '15755249'
+
+
+@pytest.fixture
+def mock(monkeypatch, tmp_path):
+    server = MockServer().start()
+    monkeypatch.setattr(gp, 'GOSZAKUP_URL', server.url)
+    monkeypatch.setattr(gp, 'ECC_URL', server.url)
+    monkeypatch.setattr(gp, 'REQUEST_DELAY', 0)
+    # batch_main writes to the relative reports/ and downloads/
+    monkeypatch.chdir(tmp_path)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(mock):
+    return OpenAI(base_url=mock.url + '/v1', api_key='mock', max_retries=0)
+
+
+def counting_prepare(prepare):
+    def wrapper(advert_id):
+        wrapper.calls += 1
+        return prepare(advert_id)
+    wrapper.calls = 0
+    return wrapper
+
+
+def run(client, prepare):
+    return run_batch_analysis(client, [ADVERT_ID], prepare, PROMPTS, state_dir='batches', poll_interval=0,
+                              max_rounds=1)
+
+
+def load_report():
+    with open(os.path.join('reports', f'goszakup_{ADVERT_ID}.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def expire_uploads():
+    with open(os.path.join('batches', 'state.json'), encoding='utf-8') as f:
+        state = json.load(f)
+    state['adverts'][ADVERT_ID]['uploaded_at'] -= BATCH_FILE_TTL + 1
+    with open(os.path.join('batches', 'state.json'), 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    return state
+
+
+def last_batch_size(mock):
+    return list(mock.state.batches.values())[-1]['request_counts']['total']
+
+
+def test_resume_after_partial_failure_and_expiry_keeps_analyses(mock, client):
+    prepare = counting_prepare(make_prepare_advert(Session(), client))
+    mock.state.failing_custom_ids = {f'{ADVERT_ID}:affiliate_analysis'}
+
+    summary = run(client, prepare)
+    assert (summary['requests_succeeded'], summary['requests_failed']) == (1, 1)
+    report = load_report()
+    assert 'techspec_analyzed' in report and 'affiliate_analysis' not in report
+
+    # the next run comes after the techspec uploads expired: the advert is scraped and uploaded again
+    expire_uploads()
+    mock.state.failing_custom_ids = set()
+    summary = run(client, prepare)
+
+    assert prepare.calls == 2
+    assert last_batch_size(mock) == 1
+    assert summary['requests_failed'] == 0
+    report = load_report()
+    assert report['organizer_name']
+    assert report['techspec_analyzed'] and report['affiliate_analysis']
+
+
+def test_done_analysis_missing_from_report_is_sent_again(mock, client):
+    prepare = make_prepare_advert(Session(), client)
+    mock.state.failing_custom_ids = {f'{ADVERT_ID}:affiliate_analysis'}
+    run(client, prepare)
+
+    # a report rewritten without its analyses, e.g. by an older prepare step
+    report = load_report()
+    del report['techspec_analyzed']
+    with open(os.path.join('reports', f'goszakup_{ADVERT_ID}.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f)
+    expire_uploads()
+    mock.state.failing_custom_ids = set()
+
+    summary = run(client, prepare)
+    assert last_batch_size(mock) == 2
+    assert summary['requests_succeeded'] == 2
+    assert all(key in load_report() for key in PROMPTS)
@@ -0,0 +1,45 @@
+import pytest
+from openai import AsyncOpenAI, BadRequestError
+from benchmarks.mock_server import MockServer, MockHandler, ANALYSIS_TEXT
+from src import openai_client
+
+
+@pytest.fixture
+def mock(monkeypatch):
+    """Mock server whose /v1/responses answers with the statuses in `server.failures` before succeeding"""
+    server = MockServer().start()
+    server.failures = []
+    handle_openai = MockHandler._handle_openai
+
+    def failing(handler, method, path, body):
+        if path == '/v1/responses' and server.failures:
+            status = server.failures.pop(0)
+            return handler._send(status, {'error': {'message': f'injected {status}'}}, extra_headers={'retry-after': '0'})
+        return handle_openai(handler, method, path, body)
+
+    monkeypatch.setattr(MockHandler, '_handle_openai', failing)
+    monkeypatch.setattr(openai_client, '_async_client',
+                        AsyncOpenAI(base_url=server.url + '/v1', api_key='mock', max_retries=0))
+    yield server
+    server.stop()
+
+
+def test_transient_errors_are_retried(mock):
+    mock.failures = [503, 500, 408]
+    assert openai_client.get_response_from_gpt('prompt', label='test') == ANALYSIS_TEXT
+    assert mock.failures == []
+
+
+def test_retried_stream_starts_the_text_over(mock):
+    mock.failures = [502]
+    chunks = []
+    text = openai_client.get_response_from_gpt(
+        'prompt', label='test', on_delta=lambda delta: chunks.clear() if delta is None else chunks.append(delta))
+    assert ''.join(chunks) == text == ANALYSIS_TEXT
+
+
+def test_client_errors_are_not_retried(mock):
+    mock.failures = [400, 400]
+    with pytest.raises(BadRequestError):
+        openai_client.get_response_from_gpt('prompt', label='test')
+    assert mock.failures == [400]
@@ -0,0 +1,96 @@
+import os
+import pytest
+from benchmarks.mock_server import MockServer, FIXTURES_DIR
+from src import samryk_api
+from src.models import parse_amount
+from src.samryk_parser import parse_advert_data
+
+ADVERT_ID = '1164921'
+AMOUNT_FIELDS = {'Общая сумма лотов', 'Количество', 'Цена за ед.', 'Сумма'}
+
+
+class PageSource:
+    """Stands in for the webdriver, parse_advert_data only reads page_source"""
+
+    def __init__(self, html):
+        self.page_source = html
+
+
+@pytest.fixture
+def mock(monkeypatch):
+    server = MockServer(listing_adverts=250).start()
+    monkeypatch.setattr(samryk_api, 'SAMRUK_URL', server.url)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def session():
+    return samryk_api.get_session()
+
+
+def browser_advert_data():
+    with open(os.path.join(FIXTURES_DIR, 'samruk', 'advert_modal.html'), encoding='utf-8') as f:
+        return parse_advert_data(PageSource(f.read().replace('{{ADVERT_ID}}', ADVERT_ID)))
+
+
+def assert_same_fields(api, browser):
+    assert api.keys() == browser.keys()
+    for key, value in browser.items():
+        if key in AMOUNT_FIELDS:
+            assert parse_amount(api[key]) == parse_amount(value), key
+        else:
+            assert api[key] == value, key
+
+
+def test_get_adverts_page(mock, session):
+    advert_ids, total_pages = samryk_api.get_adverts_page(session, 3)
+    assert total_pages == 3
+    assert advert_ids == [str(i) for i in range(40000201, 40000251)]
+
+
+def test_list_advert_ids(mock, session):
+    advert_ids = samryk_api.list_advert_ids(session)
+    assert len(advert_ids) == len(set(advert_ids)) == 250
+    assert samryk_api.list_advert_ids(session, max_pages=2) == advert_ids[:200]
+
+
+def test_get_advert_matches_browser_parser(mock, session):
+    api = samryk_api.get_advert(session, ADVERT_ID)
+    browser = browser_advert_data()
+
+    api_lots, browser_lots = api.pop('Лоты'), browser.pop('Лоты')
+    assert_same_fields(api, browser)
+    assert len(api_lots) == len(browser_lots) == 2
+    for api_lot, browser_lot in zip(api_lots, browser_lots):
+        assert api_lot.pop('lot_id') == samryk_api.lot_id_from_number(browser_lot['Номер'])
+        assert_same_fields(api_lot, browser_lot)
+
+
+def test_get_advert_files_and_download(mock, session, tmp_path):
+    files = samryk_api.get_advert_files(session, ADVERT_ID)
+    assert files == [
+        {'file_id': '9100001', 'file_name': f'techspec_{ADVERT_ID}_1.txt', 'lot_id': '4221402'},
+        {'file_id': '9100002', 'file_name': f'techspec_{ADVERT_ID}_2.txt', 'lot_id': '4221403'},
+    ]
+
+    paths = samryk_api.download_files(session, files, str(tmp_path))
+    assert [os.path.basename(path) for path in paths] == [f['file_name'] for f in files]
+    for path in paths:
+        with open(path, 'rb') as f:
+            assert f.read() == mock.state.techspec
+
+
+def test_fetch_tender(mock, session):
+    tender = samryk_api.SamrukAdapter(session).fetch_tender(ADVERT_ID)
+    assert tender.organizer_name == 'АО "Компания-1"'
+    assert tender.amount == 2050000.0
+    assert [lot.amount for lot in tender.lots] == [1250000.0, 800000.0]
+    assert [f.lot_id for f in tender.techspec_files] == ['4221402', '4221403']
+    # techspecs join to their lots like on goszakup
+    assert [lot.lot_id for lot in tender.lots] == ['4221402', '4221403']
+
+
+def test_tender_from_browser_data_has_lot_ids():
+    tender = samryk_api.tender_from_samruk(ADVERT_ID, browser_advert_data())
+    assert [lot.lot_id for lot in tender.lots] == ['4221402', '4221403']
@@ -0,0 +1,90 @@
+import threading
+import pytest
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+from src import samryk_parser
+from src.samryk_parser import BrowserPool, parse_listing_page, LISTING_ITEM, LISTING_URL
+
+
+class FakeElement:
+    def __init__(self, text):
+        self._text = text
+        self.detached = False
+
+    @property
+    def text(self):
+        if self.detached:
+            raise StaleElementReferenceException()
+        return self._text
+
+
+class FakeDriver:
+    """Hash navigation of the listing SPA: the old page stays rendered until Angular replaces it"""
+
+    render_delay = 0.3
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.current_url = 'about:blank'
+        self.items = []
+        self.quit_calls = 0
+
+    def get(self, url):
+        self.current_url = url
+        if url in self.pages:
+            threading.Timer(self.render_delay, self._render, [self.pages[url]]).start()
+        else:
+            self._render([])
+
+    def _render(self, ids):
+        for item in self.items:
+            item.detached = True
+        self.items = [FakeElement(f'№ {advert_id}') for advert_id in ids]
+
+    @property
+    def page_source(self):
+        return ''.join(
+            '<div class="m-sidebar__layout m-sidebar__layout--found-item ng-star-inserted">'
+            f'<div class="m-found-item__num ng-star-inserted">{item.text}</div></div>'
+            for item in self.items
+        )
+
+    def find_elements(self, by, value):
+        return list(self.items) if (by, value) == LISTING_ITEM else []
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException()
+        return elements[0]
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+def test_listing_page_waits_for_the_previous_page_to_go_away():
+    driver = FakeDriver({LISTING_URL.format(page_i=1): ['101', '102'], LISTING_URL.format(page_i=2): ['201']})
+
+    assert parse_listing_page(driver, 1) == ['101', '102']
+    assert parse_listing_page(driver, 2) == ['201']
+    # the same page again: the driver is sent away first so the page is really rendered anew
+    assert parse_listing_page(driver, 2) == ['201']
+
+
+def test_pool_logs_parse_errors_and_recycles_the_driver(monkeypatch):
+    drivers = []
+
+    def get_driver(download_dir, headless=True):
+        drivers.append(FakeDriver({}))
+        return drivers[-1]
+
+    def parse(driver, item, download_dir):
+        if item == 'broken':
+            raise AttributeError("'NoneType' object has no attribute 'get_text'")
+        return item.upper()
+
+    monkeypatch.setattr(samryk_parser, 'get_driver', get_driver)
+    with BrowserPool(size=1) as pool:
+        assert pool.map(parse, ['a', 'broken', 'b']) == ['A', None, 'B']
+
+    assert len(drivers) == 2
+    assert all(driver.quit_calls == 1 for driver in drivers)
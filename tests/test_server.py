@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+import pytest
+import server
+from src import profiling
+
+ADVERT_ID = 15755249
+REPORT = {
+    'organizer_name': 'ТОО "Организатор"',
+    'lots_info': [],
+    'techspec_files': [],
+    'techspec_analyzed': 'Анализ',
+    'affiliate_analysis': 'Анализ',
+}
+
+
+@pytest.fixture
+def started(monkeypatch, tmp_path):
+    """Tasks the server would start: (advert_id, profile, previous); nothing is really run"""
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    monkeypatch.setattr(server, 'start_task', lambda advert_id, profile=False, previous=None:
+                        calls.append((advert_id, profile, previous)))
+    monkeypatch.setattr(server, 'running_tasks', {})
+    monkeypatch.setattr(server, 'tasks_status', {})
+    server._report_cache.clear()
+    return calls
+
+
+def save_fresh_report():
+    os.makedirs('reports', exist_ok=True)
+    with open(os.path.join('reports', f'goszakup_{ADVERT_ID}.json'), 'w', encoding='utf-8') as f:
+        json.dump(REPORT, f, ensure_ascii=False)
+
+
+def parse(**data):
+    async def post():
+        response = await server.app.test_client().post('/api/parse', json={'advert_id': ADVERT_ID, **data})
+        assert response.status_code == 200
+        return await response.get_json()
+    return asyncio.run(post())
+
+
+def test_sampled_profile_serves_fresh_report(started, monkeypatch):
+    save_fresh_report()
+    monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_RATE', 1.0)
+
+    data = parse()
+    assert data['message'] == 'Report is fresh'
+    assert started == []
+
+
+def test_sampled_profile_applies_to_started_task(started, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_RATE', 1.0)
+
+    parse()
+    assert started == [(ADVERT_ID, True, None)]
+
+
+def test_explicit_profile_skips_fresh_report(started):
+    save_fresh_report()
+
+    parse(profile=True)
+    assert started == [(ADVERT_ID, True, None)]
+
+
+def test_force_on_running_task_is_reported_as_not_applied(started, monkeypatch):
+    monkeypatch.setitem(server.running_tasks, str(ADVERT_ID), lambda: None)
+
+    data = parse(force=True)
+    assert data['message'] == 'Task already running'
+    assert data['force_applied'] is False
+    assert started == []
+
+    assert 'force_applied' not in parse()